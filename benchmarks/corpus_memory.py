@@ -0,0 +1,40 @@
+"""
+Compares the memory footprint and lookup cost of the pandas dataframe that
+Lyrics used to hold against the compact Corpus that replaced it.
+
+Usage (from the repository root):
+    python benchmarks/corpus_memory.py [path/to/lyrics.csv]
+"""
+import sys
+import random
+import timeit
+import tracemalloc
+import pandas as pd
+
+from servertools.Corpus import Corpus
+
+CSV_PATH = sys.argv[1] if len(sys.argv) > 1 else "./TAYLOR_LYRICS_JUN2024.csv"
+LOOKUPS = 100_000
+
+def traced(build):
+    """Returns the object built by `build` and the bytes it kept allocated"""
+    tracemalloc.start()
+    obj = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, retained
+
+data, df_retained = traced(lambda: pd.read_csv(CSV_PATH))
+corpus, corpus_retained = traced(lambda: Corpus.from_dataframe(data))
+
+rows = [random.randint(0, len(corpus) - 1) for _ in range(LOOKUPS)]
+df_time = timeit.timeit(lambda: [(data["lyric"][i], data["track_name"][i]) for i in rows], number=1)
+corpus_time = timeit.timeit(lambda: [(corpus.lyric(i), corpus.track_name(i)) for i in rows], number=1)
+
+df_bytes = data.memory_usage(deep=True).sum()
+print(f"rows: {len(corpus)}")
+print(f"dataframe: {df_bytes / 1024:9.1f} KiB (deep), {df_retained / 1024:9.1f} KiB retained")
+print(f"corpus:    {corpus.nbytes / 1024:9.1f} KiB (nbytes), {corpus_retained / 1024:9.1f} KiB retained")
+print(f"memory reduction: {df_bytes / corpus.nbytes:.1f}x")
+print(f"{LOOKUPS} lyric + track lookups: dataframe {df_time * 1000:.1f} ms, corpus {corpus_time * 1000:.1f} ms "
+      f"({df_time / corpus_time:.1f}x faster)")
@@ -0,0 +1,57 @@
+"""
+Compares the bounded edit distance used to check guesses against the full
+stringdist.levenshtein computation it replaced, on the kinds of guesses
+players make: exact answers, typos, wrong titles and pasted lyrics.
+
+Usage (from the repository root):
+    python benchmarks/edit_distance.py [path/to/lyrics.csv]
+"""
+import sys
+import math
+import random
+import timeit
+import warnings
+import stringdist
+
+from servertools.Corpus import load_shared_corpus
+from servertools.TitleMatcher import TYPO_TOLERANCE, bounded_levenshtein
+
+# stringdist uses a deprecated argument format; keep the output readable
+warnings.simplefilter("ignore", DeprecationWarning)
+
+CSV_PATH = sys.argv[1] if len(sys.argv) > 1 else "./TAYLOR_LYRICS_JUN2024.csv"
+PAIRS = 2000
+
+corpus = load_shared_corpus(CSV_PATH)
+rng = random.Random(0)
+titles = [title.lower() for title in corpus.track_names]
+long_titles = sorted(titles, key=len)[-40:]
+
+def typo(title):
+    chars = list(title)
+    for _ in range(rng.randint(1, 3)):
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghij")
+    return "".join(chars)
+
+def pasted_lyrics():
+    start = rng.randrange(len(corpus) - 8)
+    return " ".join(corpus.lyrics(start, start + rng.randint(1, 8))).lower()
+
+cases = {"exact": [(title, title) for title in rng.choices(titles, k=PAIRS)],
+         "typo (long titles)": [(typo(title), title) for title in rng.choices(long_titles, k=PAIRS)],
+         "wrong title": [(rng.choice(titles), title) for title in rng.choices(titles, k=PAIRS)],
+         "pasted lyrics": [(pasted_lyrics(), title) for title in rng.choices(titles, k=PAIRS)]}
+
+print(f"{'case':<20}{'stringdist':>14}{'bounded':>14}{'speedup':>10}")
+for name, pairs in cases.items():
+    bounds = [math.ceil(len(title) * TYPO_TOLERANCE) for _, title in pairs]
+    full = [stringdist.levenshtein(guess, title) <= bound for (guess, title), bound in zip(pairs, bounds)]
+    bounded = [bounded_levenshtein(guess, title, bound) <= bound for (guess, title), bound in zip(pairs, bounds)]
+    assert full == bounded, f"accept/reject results differ for {name}"
+
+    full_time = timeit.timeit(lambda: [stringdist.levenshtein(guess, title) <= bound
+                                       for (guess, title), bound in zip(pairs, bounds)], number=5) / 5
+    bounded_time = timeit.timeit(lambda: [bounded_levenshtein(guess, title, bound) <= bound
+                                          for (guess, title), bound in zip(pairs, bounds)], number=5) / 5
+    print(f"{name:<20}{full_time / PAIRS * 1e6:>11.2f} us{bounded_time / PAIRS * 1e6:>11.2f} us"
+          f"{full_time / bounded_time:>9.1f}x")
@@ -0,0 +1,161 @@
+"""
+Simulates many players at once to find how many concurrent games one worker
+can serve. Each bot plays full Survival and Casual games through GameSession
+(so rounds come from Lyrics, guesses go through the title matcher, and
+eligible Survival games are submitted to a scratch leaderboard database),
+taking hints, making typos, guessing wrong and giving up along the way.
+
+For each difficulty and album subset, reports the rounds played per second,
+the p50/p99 latency of each operation and the peak RSS so far (of the
+largest worker process, with --processes).
+
+With --writer, results are submitted through the background
+LeaderboardWriter (as the app does) rather than added directly, and the
+submit latency is the time until the results are written.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py [--players N] [--workers N] [--processes]
+                                   [--writer] [--max-rounds N] [--csv path/to/lyrics.csv]
+"""
+import os
+import time
+import random
+import argparse
+import resource
+import tempfile
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from servertools.Corpus import load_shared_corpus
+from servertools.GameSession import GameSession, POINTS_MAPPING
+from servertools.Leaderboard import Leaderboards, get_writer
+
+ALBUM_SUBSETS = {"all albums": None,
+                 "folklore + evermore": ["folklore", "evermore"],
+                 "Midnights": ["Midnights"]}
+# how the bots play
+CORRECT_RATE = 0.6
+TYPO_RATE = 0.3
+GIVEUP_RATE = 0.1
+HINT_RATE = 0.2
+OPERATIONS = ["new game", "round", "guess", "hint", "give up", "submit"]
+
+def typo(title, rng):
+    chars = list(title)
+    chars[rng.randrange(len(chars))] = rng.choice("abcdefghij")
+    return "".join(chars)
+
+def play_games(csv_path, db_path, difficulty, albums, players, max_rounds, seed, use_writer=False):
+    """
+    Plays one game per player, alternating Survival and Casual (capped at
+    max_rounds, since Casual games never end on their own).
+
+    Returns:
+        A tuple (rounds played, {operation: [latencies in seconds]}, the
+        peak RSS of this process in MB).
+    """
+    corpus = load_shared_corpus(csv_path)
+    rng = random.Random(seed)
+    timings = defaultdict(list)
+
+    def timed(operation, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[operation].append(time.perf_counter() - start)
+        return result
+
+    rounds = 0
+    for player in range(players):
+        survival = player % 2 == 0
+        game = timed("new game", GameSession, corpus, difficulty, survival, albums, rng.getrandbits(63))
+        while not game.finished:
+            while game.can_hint() and rng.random() < HINT_RATE:
+                timed("hint", game.hint)
+            if rng.random() < GIVEUP_RATE:
+                timed("give up", game.give_up)
+            else:
+                while not game.round_over and not game.finished:
+                    title = game.current.track_name
+                    if rng.random() < CORRECT_RATE:
+                        guess = typo(title, rng) if rng.random() < TYPO_RATE else title
+                    else:
+                        guess = rng.choice(corpus.track_names)
+                    timed("guess", game.guess, guess)
+                    if not survival and not game.round_over and rng.random() < GIVEUP_RATE:
+                        timed("give up", game.give_up)
+            if game.finished:
+                break
+            if not survival and game.round_count >= max_rounds:
+                game.end()
+                break
+            timed("round", game.new_round)
+        rounds += game.round_count
+
+        # the app's rule for leaderboard eligibility
+        if game.survival and game.albums is None and game.round_count >= 5:
+            results = (f"bot{player}", game.points, game.round_count, int(time.time()))
+            if use_writer:
+                # waited on right away (which raises if the write failed), as
+                # a player waits for their rank; the writer still batches the
+                # submissions of concurrent workers
+                start = time.perf_counter()
+                future = get_writer(db_path).submit(difficulty, results)
+                future.result()
+                timings["submit"].append(time.perf_counter() - start)
+            else:
+                with Leaderboards(db_path) as leaderboard:
+                    timed("submit", leaderboard.add_to_leaderboard, difficulty, results)
+    return rounds, dict(timings), peak_rss_mb()
+
+def peak_rss_mb():
+    """The peak resident set size of this process so far, in MB"""
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs synthetic players through full games.")
+    parser.add_argument("--players", type=int, default=1000, help="players per difficulty and album subset")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent workers")
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--writer", action="store_true", 
+                        help="submit results through the background LeaderboardWriter, as the app does")
+    parser.add_argument("--max-rounds", type=int, default=30, help="rounds per Casual game")
+    parser.add_argument("--csv", default="./TAYLOR_LYRICS_JUN2024.csv", help="the lyrics CSV")
+    args = parser.parse_args()
+
+    executor_class = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    db_path = os.path.join(tempfile.mkdtemp(), "leaderboard.db")
+    per_worker = [args.players // args.workers + (i < args.players % args.workers) for i in range(args.workers)]
+
+    header = f"{'difficulty':<12}{'albums':<22}{'rounds/s':>10}"
+    header += "".join(f"{operation + ' p50/p99 (ms)':>26}" for operation in OPERATIONS)
+    header += f"{'peak RSS (MB)':>15}"
+    print(f"{args.players} players, {args.workers} {'processes' if args.processes else 'threads'}"
+          + (", submitting through the writer" if args.writer else ""))
+    print(header)
+    with executor_class(args.workers) as executor:
+        for difficulty in POINTS_MAPPING:
+            for subset, albums in ALBUM_SUBSETS.items():
+                start = time.perf_counter()
+                futures = [executor.submit(play_games, args.csv, db_path, difficulty, albums, players,
+                                           args.max_rounds, seed, args.writer)
+                           for seed, players in enumerate(per_worker) if players]
+                results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+
+                rounds = sum(worker_rounds for worker_rounds, _, _ in results)
+                line = f"{difficulty.split()[0]:<12}{subset:<22}{rounds / elapsed:>10.0f}"
+                for operation in OPERATIONS:
+                    latencies = [latency for _, timings, _ in results for latency in timings.get(operation, [])]
+                    if latencies:
+                        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+                        line += f"{p50:>17.3f} / {p99:<6.3f}"
+                    else:
+                        line += f"{'-':>26}"
+                # with processes, the largest worker's; with threads, this process's
+                line += f"{max(rss for _, _, rss in results):>15.0f}"
+                print(line)
+
+if __name__ == "__main__":
+    main()
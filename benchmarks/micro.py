@@ -0,0 +1,172 @@
+"""
+Micro-benchmarks for the servertools hot paths: building Lyrics, generating
+rounds, checking guesses, and adding to and reading the leaderboards (at
+several leaderboard sizes). Results are written as JSON, and two result files
+can be compared, failing if any benchmark got slower than a threshold.
+
+Usage (from the repository root):
+    python benchmarks/micro.py run [-o results.json] [--sizes 1000,100000,1000000]
+    python benchmarks/micro.py compare baseline.json results.json [--threshold 10]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import platform
+import argparse
+import tempfile
+import warnings
+import pandas as pd
+
+from servertools.Corpus import Corpus
+from servertools.Lyrics import Lyrics, MODE_PROMPTS
+from servertools.Leaderboard import Leaderboards
+
+# stringdist uses a deprecated argument format; keep the output readable
+warnings.simplefilter("ignore", DeprecationWarning)
+
+DIFFICULTIES = list(MODE_PROMPTS)
+ACCEPTABLE_ANSWERS = {"Mary's Song (Oh My My My)": ["Mary's Song"],
+                      "...Ready For It?": ["Ready For It?"],
+                      "ME!": ["ME"]}
+KEEP_PARENTHESES = ["Mary's Song (Oh My My My)", "I Can Fix Him (No Really I Can)"]
+
+def measure(fn, setup=None, target_seconds=0.2, repeats=5):
+    """
+    Times fn, calling setup (untimed) before each call if given.
+
+    Returns:
+        A dict with the median and minimum seconds per call, over repeats
+        runs of enough calls to take about target_seconds each.
+    """
+    def run(number):
+        total = 0.0
+        for _ in range(number):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            total += time.perf_counter() - start
+        return total
+
+    # calibrate the number of calls per run
+    number = 1
+    while run(number) < target_seconds / 10 and number < 1_000_000:
+        number *= 10
+    number = max(1, int(number * target_seconds / max(run(number), 1e-9)))
+    times = sorted(run(number) / number for _ in range(repeats))
+    return {"seconds": times[len(times) // 2], "min_seconds": times[0], "calls": number * repeats}
+
+def fill_leaderboard(db_path, rows, rng):
+    """Creates a leaderboard database with the given number of rows, spread over the difficulties"""
+    with Leaderboards(db_path) as leaderboard:
+        now = int(time.time())
+        data = [(rng.choice(["easy", "medium", "hard"]), f"player{i}", rng.randint(-10, 500),
+                 rng.randint(1, 100), now - rng.randint(0, 365 * 86400)) for i in range(rows)]
+        leaderboard.cursor.executemany("""INSERT INTO leaderboard (difficulty, name, points, rounds, timestamp)
+                                          VALUES (?, ?, ?, ?, ?)""", data)
+        leaderboard.connection.commit()
+        leaderboard.cursor.execute("ANALYZE")
+
+def run_benchmarks(csv_path, sizes):
+    rng = random.Random(0)
+    results = {}
+
+    def record(name, result):
+        results[name] = result
+        print(f"{name:<62}{result['seconds'] * 1e6:>14.2f} us")
+
+    data = pd.read_csv(csv_path)
+    corpus = Corpus.from_dataframe(data)
+    record("Lyrics.__init__ (DataFrame)", measure(lambda: Lyrics(data=data), target_seconds=1))
+    record("Lyrics.__init__ (Corpus)", measure(lambda: Lyrics(data=corpus)))
+
+    lyrics = Lyrics(data=corpus, seed=0)
+    for difficulty in DIFFICULTIES:
+        record(f"Lyrics.generate [{difficulty}]", measure(lambda: lyrics.generate(difficulty)))
+
+    lyrics.generate(DIFFICULTIES[0])
+    title = lyrics.get_track_name()
+    guesses = {"exact": title,
+               "typo": title[:-2] + "xq" if len(title) > 4 else title,
+               "garbage": " ".join(corpus.lyrics(0, 3))}
+    check = lambda guess: lyrics.get_guess_feedback(guess, acceptable_answers=ACCEPTABLE_ANSWERS,
+                                                    remove_parentheses=True, keep_parentheses=KEEP_PARENTHESES)
+    check(title)
+    for kind, guess in guesses.items():
+        record(f"Lyrics.get_guess_feedback [{kind}]", measure(lambda: check(guess)))
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "leaderboard.db")
+            fill_leaderboard(db_path, size, rng)
+            with Leaderboards(db_path) as leaderboard:
+                difficulty = rng.choice(DIFFICULTIES)
+                record(f"Leaderboards.add_to_leaderboard [{size} rows]",
+                       measure(lambda: leaderboard.add_to_leaderboard(difficulty, ("bench", rng.randint(-10, 500),
+                                                                                   rng.randint(1, 100), int(time.time())))))
+                # the cache is dropped before each call, so every call queries the database
+                record(f"Leaderboards.get_leaderboards [{size} rows, page]",
+                       measure(lambda: leaderboard.get_leaderboards(limit=25), setup=leaderboard.pool.bump_version))
+                record(f"Leaderboards.get_leaderboards [{size} rows, page, cached]",
+                       measure(lambda: leaderboard.get_leaderboards(limit=25)))
+    return results
+
+def compare(baseline_path, results_path, threshold):
+    """
+    Prints each benchmark's change from the baseline.
+
+    Returns:
+        The number of benchmarks that got slower by more than threshold percent.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(results_path) as f:
+        results = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'benchmark':<62}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<62}{'-':>14}{result['seconds'] * 1e6:>11.2f} us{'new':>10}")
+            continue
+        before, after = baseline[name]["seconds"], result["seconds"]
+        change = (after - before) * 100 / before
+        regressed = change > threshold
+        regressions += regressed
+        print(f"{name:<62}{before * 1e6:>11.2f} us{after * 1e6:>11.2f} us{change:>+9.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for servertools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="runs the benchmarks")
+    run_parser.add_argument("-o", "--output", default="benchmark_results.json", help="the JSON file to write")
+    run_parser.add_argument("--csv", default="./TAYLOR_LYRICS_JUN2024.csv", help="the lyrics CSV")
+    run_parser.add_argument("--sizes", default="1000,100000,1000000",
+                            help="comma-separated leaderboard sizes (in rows)")
+    compare_parser = commands.add_parser("compare", help="compares two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="the slowdown (in percent) that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.csv, [int(size) for size in args.sizes.split(",")])
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                       "machine": platform.platform(), "timestamp": int(time.time()),
+                       "results": results}, f, indent=2)
+        print(f"wrote {args.output}")
+    else:
+        regressions = compare(args.baseline, args.results, args.threshold)
+        if regressions:
+            print(f"{regressions} benchmark(s) regressed by more than {args.threshold}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
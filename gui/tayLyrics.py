@@ -1,14 +1,21 @@
 import os
+import math
+import time
+import uuid
+import tempfile
+import functools
 import streamlit as st
-import pandas as pd
-from datetime import datetime
-import pytz
 
-from servertools.Lyrics import Lyrics
-from servertools.Leaderboard import Leaderboards
+from servertools.Corpus import load_shared_corpus
+from servertools.GameSession import GameSession, POINTS_MAPPING, HINTS_LIMIT
+from servertools.Leaderboard import Leaderboards, get_writer, window_start, WINDOWS
+from servertools.Metrics import ACTIVE_SESSIONS, start_metrics_server
+from servertools.Timing import (timed, get_histogram, timing_report, claim_session_profiler, 
+                                TIMING_ENABLED, PROFILE_DIR)
 
 ### GLOBAL VARS ###
-ALL_LYRICS = pd.read_csv("./TAYLOR_LYRICS_JUN2024.csv")
+# loaded once per process and shared (read-only) by every session
+CORPUS = load_shared_corpus("./TAYLOR_LYRICS_JUN2024.csv")
 ALL_ALBUMS = ["Taylor Swift", 
               "Fearless (Taylor's Version)",
               "Speak Now (Taylor's Version)", 
@@ -25,12 +32,15 @@ KEEP_PARENTHESES =  ["Mary's Song (Oh My My My)",
 DIFFICULTIES = ["Easy (an entire section, e.g. chorus)", 
                 "Medium (2 lines)", 
                 "Hard (1 line)"]
-HINTS_LIMIT = 20
+LEADERBOARD_PAGE_SIZE = 25
+# leaderboard downloads are written here, and deleted after this many seconds
+# if they are not downloaded
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "taylyrics-exports")
+EXPORT_TTL = 600
+# how often (in seconds) the page checks whether a submission has been written
+SUBMISSION_POLL_INTERVAL = 0.25
 GAME_MODES = [f"Survival (with 5 lives, {HINTS_LIMIT} hints)",
               "Casual (unlimited lives and hints)"]
-POINTS_MAPPING = {"Easy (an entire section, e.g. chorus)": 1, 
-                  "Medium (2 lines)": 3, 
-                  "Hard (1 line)": 5}
 DIFFICULTY_MAPPING = {"Easy (an entire section, e.g. chorus)": "Easy", 
                       "Medium (2 lines)": "Medium", 
                       "Hard (1 line)": "Hard"}
@@ -113,6 +123,11 @@ ACCEPTABLE_ANSWERS = {"Mary's Song (Oh My My My)": ["Mary's Song"],
                       "Question...?": ["Question"],
                       "I Can Fix Him (No Really I Can)": ["I Can Fix Him"]}
 
+# timing and profiling are switched on through the environment; see servertools.Timing
+RERUN_START = time.perf_counter()
+# served only if TAYLYRICS_METRICS_PORT is set; see servertools.Metrics
+start_metrics_server()
+
 ### PAGE CONFIG
 st.set_page_config(layout='wide',
                    page_title="tayLyrics",
@@ -121,58 +136,23 @@ st.set_page_config(layout='wide',
                    menu_items={'About': "#### tayLyrics: A lyrics guessing game for Swifties"})
 
 ### SESSION STATES ###
-if "game_in_progress" not in st.session_state: 
-    st.session_state.game_in_progress = False
-if "lyrics" not in st.session_state: 
-    st.session_state.lyrics = Lyrics(data=ALL_LYRICS)
-if "generated_lyrics" not in st.session_state: 
-    st.session_state.generated_lyrics = None
-if "correct_song" not in st.session_state: 
-    st.session_state.correct_song = None
-if "correct_album" not in st.session_state: 
-    st.session_state.correct_album = None
-if "correct_section" not in st.session_state: 
-    st.session_state.correct_section = None
-if "next_line" not in st.session_state: 
-    st.session_state.next_line = None
-if "prev_line" not in st.session_state: 
-    st.session_state.prev_line = None
-if "round_count" not in st.session_state: 
-    st.session_state.round_count = 1
+# the current (or last) game; all game state lives here
+if "game" not in st.session_state: 
+    st.session_state.game = None
 if "guess" not in st.session_state:
     st.session_state.guess = None
-if "disable_buttons" not in st.session_state: 
-    st.session_state.disable_buttons = False
 if "correct_feedback" not in st.session_state: 
     st.session_state.correct_feedback = ""
 if "incorrect_feedback" not in st.session_state: 
     st.session_state.incorrect_feedback = ""
-if "points" not in st.session_state: 
-    st.session_state.points = 0
-if "round_results" not in st.session_state:
-    st.session_state.round_results = []
-if "streak" not in st.session_state:
-    st.session_state.streak = 0
-if "streaks" not in st.session_state:
-    st.session_state.streaks = []
-if "album_counter" not in st.session_state: 
-    st.session_state.album_counter = {}
 if "difficulty" not in st.session_state:
     st.session_state.difficulty = None
 if "game_mode" not in st.session_state:
     st.session_state.game_mode = None
 if "albums" not in st.session_state:
     st.session_state.albums = []
-if "lives" not in st.session_state:
-    st.session_state.lives = 5
-if "hints" not in st.session_state:
-    st.session_state.hints = 0
-if "hints_used" not in st.session_state:
-    st.session_state.hints_used = 0
 if "gameover_feedback" not in st.session_state:
     st.session_state.gameover_feedback = ""
-if "disable_hint_btn" not in st.session_state:
-    st.session_state.disable_hint_btn = False
 if "hint_feedback" not in st.session_state:
     st.session_state.hint_feedback = ""
 if "giveup_feedback" not in st.session_state:
@@ -185,18 +165,44 @@ if "enable_leaderboard" not in st.session_state:
     st.session_state.enable_leaderboard = False
 if "disable_name_input" not in st.session_state: 
     st.session_state.disable_name_input = False
-if "submitted_datetime" not in st.session_state: 
-    st.session_state.submitted_datetime = None
+if "submitted_id" not in st.session_state: 
+    st.session_state.submitted_id = None
+if "submission" not in st.session_state: 
+    st.session_state.submission = None
 if "rank_msg" not in st.session_state:
     st.session_state.rank_msg = ""
+if "submission_error" not in st.session_state:
+    st.session_state.submission_error = ""
+if "export" not in st.session_state: 
+    st.session_state.export = None
 if "start_btn_clicked" not in st.session_state:
     st.session_state.start_btn_clicked = False
-if "hide_buttons" not in st.session_state:
-    st.session_state.hide_buttons = False
-if "hints_limit" not in st.session_state:
-    st.session_state.hints_limit = HINTS_LIMIT
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+ACTIVE_SESSIONS.touch(st.session_state.session_id)
+# only one session per process is profiled
+if "profiler" not in st.session_state:
+    st.session_state.profiler = claim_session_profiler()
+if st.session_state.profiler is not None:
+    st.session_state.profiler.start()
 
 ### FUNCTIONS ###
+def callback(fn):
+    """Times the decorated callback and, if this session is being profiled, profiles it"""
+    fn = timed(fn)
+    if PROFILE_DIR is None:
+        return fn
+    
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = st.session_state.get("profiler")
+        if profiler is None:
+            return fn(*args, **kwargs)
+        with profiler:
+            return fn(*args, **kwargs)
+    return wrapper
+
+@callback
 def apply_theme(selected_theme):
     css = f"""
     <style>
@@ -269,6 +275,7 @@ def apply_theme(selected_theme):
     """
     st.markdown(css, unsafe_allow_html=True)
 
+@callback
 def clear_guess(): 
     """Clears the guess text input once an answer is submitted"""
     st.session_state.guess = st.session_state.temp_guess
@@ -281,241 +288,228 @@ def clear_feedback():
     st.session_state.hint_feedback = ""
     st.session_state.gameover_feedback = ""
 
-def filter_lyrics():
-    """Resets the lyrics generator such that it only generates lyrics from the selected albums"""
-    selected_albums = [ALBUMS_MAPPING_INVERSE[short] for short in st.session_state.albums]
-    filtered_lyrics = ALL_LYRICS[ALL_LYRICS["album_name"].isin(selected_albums)].reset_index()
-    st.session_state.lyrics = Lyrics(data=filtered_lyrics)
-
+@callback
 def game_started(): 
-    
-    st.session_state.game_in_progress = True
 
     clear_feedback()
 
+    # only restrict the albums if some were deselected
     if len(st.session_state.albums) != len(ALL_ALBUMS):
-        filter_lyrics()
-    
+        albums = [ALBUMS_MAPPING_INVERSE[short] for short in st.session_state.albums]
     else: 
-        st.session_state.lyrics = Lyrics(data=ALL_LYRICS)
-
-    (st.session_state.generated_lyrics, 
-    st.session_state.correct_song, 
-    st.session_state.correct_album, 
-    st.session_state.next_line, 
-    st.session_state.prev_line, 
-    st.session_state.correct_section) = regenerate()
-    
-    st.session_state.album_counter = {album_name: [] for album_name in st.session_state.albums}
+        albums = None
+
+    st.session_state.game = GameSession(CORPUS, st.session_state.difficulty, 
+                                        survival=MODE_MAPPING[st.session_state.game_mode] == "Survival",
+                                        albums=albums,
+                                        acceptable_answers=ACCEPTABLE_ANSWERS,
+                                        remove_parentheses=True,
+                                        keep_parentheses=KEEP_PARENTHESES)
     st.session_state.enable_leaderboard = False
     st.session_state.disable_name_input = False
-    st.session_state.submitted_datetime = None
+    st.session_state.submitted_id = None
+    st.session_state.submission = None
     st.session_state.rank_msg = ""
-    st.session_state.round_count = 1
-    st.session_state.round_results = []
-    st.session_state.disable_buttons = False
-    st.session_state.disable_hint_btn = False
-    st.session_state.points = 0
-    st.session_state.streak = 0
-    st.session_state.streaks = []
-    st.session_state.hints = 0
-    st.session_state.hints_used = 0
-    st.session_state.lives = 5
+    st.session_state.submission_error = ""
     st.session_state.guess = None
-    st.session_state.hide_buttons = False
-    st.session_state.hints_limit = HINTS_LIMIT
 
+@callback
 def new_round():
-    st.session_state.round_count += 1
-    st.session_state.disable_buttons = False
-    if st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)":
-        if not st.session_state.hints_used == st.session_state.hints_limit:
-            st.session_state.disable_hint_btn = False
-    else:
-        st.session_state.disable_hint_btn = False
-    st.session_state.hints = 0
+    st.session_state.game.new_round()
     st.session_state.guess = None
-    st.session_state.hide_buttons = False
 
     clear_feedback()
 
-    (st.session_state.generated_lyrics, 
-     st.session_state.correct_song, 
-     st.session_state.correct_album, 
-     st.session_state.next_line, 
-     st.session_state.prev_line, 
-     st.session_state.correct_section) = regenerate()
-
-def regenerate():
-    generated_lyrics = f'<div class="lyrics">{st.session_state.lyrics.generate(st.session_state.difficulty)}</div>'
-    correct_song = st.session_state.lyrics.get_track_name()
-    correct_album = st.session_state.lyrics.get_album_name()
-    next_line = st.session_state.lyrics.get_next_line()
-    prev_line = st.session_state.lyrics.get_previous_line()
-    section = st.session_state.lyrics.get_section()
-
-    return generated_lyrics, correct_song, correct_album, next_line, prev_line, section
+@callback
+def check_guess():
+    game = st.session_state.game
+    hints_limit = game.hints_limit
+    if game.guess(st.session_state.guess): 
+        answered_correctly(earned_hint=game.hints_limit > hints_limit)
+    else: 
+        answered_incorrectly()
 
-def answered_correctly():
+def answered_correctly(earned_hint=False):
+    game = st.session_state.game
     st.session_state.incorrect_feedback = ""
-    st.session_state.points += POINTS_MAPPING[st.session_state.difficulty]
-    st.session_state.correct_feedback = f"""That is correct! The answer is indeed **{st.session_state.correct_song}**, 
-                                            {st.session_state.correct_section}, from the album **{st.session_state.correct_album}**.
-                                            \n\nYou earned {POINTS_MAPPING[st.session_state.difficulty]} points and have 
-                                            {st.session_state.points} total points."""
-    if (st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)") and (st.session_state.round_count + 1) % 10 == 0:
-        st.session_state.hints_limit += 1
-        st.session_state.correct_feedback += f"\n\nYou reached Round {st.session_state.round_count + 1} and earned one more hint! You have {st.session_state.hints_limit - st.session_state.hints_used} hints remaining." 
-    st.session_state.round_results.append(True)
+    st.session_state.correct_feedback = f"""That is correct! The answer is indeed **{game.current.track_name}**, 
+                                            {game.current.section}, from the album **{game.current.album_name}**.
+                                            \n\nYou earned {POINTS_MAPPING[game.difficulty]} points and have 
+                                            {game.points} total points."""
+    if earned_hint:
+        st.session_state.correct_feedback += f"\n\nYou reached Round {game.round_count + 1} and earned one more hint! You have {game.hints_remaining} hints remaining." 
     st.session_state.guess = None
-    st.session_state.disable_buttons = True
-    st.session_state.disable_hint_btn = True
-    st.session_state.streak += 1
-    correct_album_short = ALBUMS_MAPPING[st.session_state.correct_album]
-    st.session_state.album_counter[correct_album_short].append(True)
-    st.session_state.hide_buttons = True
     st.session_state.hint_feedback = ""
 
 def answered_incorrectly():
-    st.session_state.points -= 1
-    st.session_state.incorrect_feedback = f'''"{st.session_state.guess}" is not correct. Please try again!\n\nYou lost 1 point and have **{st.session_state.points} total points**.'''
-    st.session_state.lives -= 1
-    st.session_state.streaks.append(st.session_state.streak)
-    st.session_state.streak = 0
-
-    if st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)":
-        st.session_state.incorrect_feedback += f"\n\nYou lost a life and have **{st.session_state.lives} lives** left."
-        if st.session_state.lives == 0:
-            st.session_state.disable_buttons = True
-            st.session_state.round_results.append(False)
-            correct_album_short = ALBUMS_MAPPING[st.session_state.correct_album]
-            st.session_state.album_counter[correct_album_short].append(False)
+    game = st.session_state.game
+    st.session_state.incorrect_feedback = f'''"{st.session_state.guess}" is not correct. Please try again!\n\nYou lost 1 point and have **{game.points} total points**.'''
+
+    if game.survival:
+        st.session_state.incorrect_feedback += f"\n\nYou lost a life and have **{game.lives} lives** left."
+        if game.finished:
             st.session_state.gameover_feedback = f'''"{st.session_state.guess}" is not correct.
                                                      \n\n**GAME OVER**: You ran out of lives! Please start a new game.
-                                                     \n\nThe correct answer was **{st.session_state.correct_song}**, {st.session_state.correct_section}, from the album **{st.session_state.correct_album}**.'''
+                                                     \n\nThe correct answer was **{game.current.track_name}**, {game.current.section}, from the album **{game.current.album_name}**.'''
             st.session_state.incorrect_feedback = ""
             end_game()
             st.rerun()
     st.session_state.guess = None
 
+@callback
 def hint():
-    st.session_state.hints += 1
-    st.session_state.hints_used += 1
-    st.session_state.points -= 1
+    game = st.session_state.game
+    hint_number, revealed = game.hint()
     remainder = ""
 
-    if (st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)"):
-        remainder = f" ({st.session_state.hints_limit - st.session_state.hints_used} remaining) " 
-        if (st.session_state.hints_used == st.session_state.hints_limit):
-            st.session_state.disable_hint_btn = True
-            st.session_state.hint_feedback += f"\n\n:orange[WARNING: The following is Hint {st.session_state.hints_limit} and the last hint for this game! You can earn another hint if you reach Round {round(st.session_state.round_count + 6, -1)}.]\n\n"
+    if game.survival:
+        remainder = f" ({game.hints_remaining} remaining) " 
+        if game.hints_remaining == 0:
+            st.session_state.hint_feedback += f"\n\n:orange[WARNING: The following is Hint {game.hints_limit} and the last hint for this game! You can earn another hint if you reach Round {round(game.round_count + 6, -1)}.]\n\n"
 
-    if st.session_state.hints == 1: 
-        st.session_state.hint_feedback += f"Hint 1{remainder}: this song comes from the album **{st.session_state.correct_album}**"
-    if st.session_state.hints == 2: 
-        st.session_state.hint_feedback += f'\n\nHint 2{remainder}: the next line of this song is *"{st.session_state.next_line}"*'
-    if st.session_state.hints == 3: 
-        st.session_state.disable_hint_btn = True
-        st.session_state.hint_feedback += f'\n\nHint 3{remainder}: the previous line of this song is *"{st.session_state.prev_line}"*'
+    if hint_number == 1: 
+        st.session_state.hint_feedback += f"Hint 1{remainder}: this song comes from the album **{revealed}**"
+    if hint_number == 2: 
+        st.session_state.hint_feedback += f'\n\nHint 2{remainder}: the next line of this song is *"{revealed}"*'
+    if hint_number == 3: 
+        st.session_state.hint_feedback += f'\n\nHint 3{remainder}: the previous line of this song is *"{revealed}"*'
 
+@callback
 def giveup():
+    game = st.session_state.game
     st.session_state.incorrect_feedback = ""
     st.session_state.hint_feedback = ""
-    st.session_state.disable_buttons = True
-    st.session_state.disable_hint_btn = True
-    st.session_state.points -= 2
-    st.session_state.lives -= 1
-    st.session_state.round_results.append(False)
-    st.session_state.streaks.append(st.session_state.streak)
-    st.session_state.streak = 0
-    st.session_state.hide_buttons = True
-    correct_album_short = ALBUMS_MAPPING[st.session_state.correct_album]
-    st.session_state.album_counter[correct_album_short].append(False)
-
-    st.session_state.giveup_feedback = f"""The correct answer was **{st.session_state.correct_song}**, {st.session_state.correct_section}, from the album **{st.session_state.correct_album}**\n\nYou lost 2 points and have **{st.session_state.points} total points**."""        
-
-    if st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)":
-        st.session_state.giveup_feedback += f"\n\nYou lost a life and have **{st.session_state.lives} lives** left."
-        if st.session_state.lives == 0: 
+    game.give_up()
+
+    st.session_state.giveup_feedback = f"""The correct answer was **{game.current.track_name}**, {game.current.section}, from the album **{game.current.album_name}**\n\nYou lost 2 points and have **{game.points} total points**."""        
+
+    if game.survival:
+        st.session_state.giveup_feedback += f"\n\nYou lost a life and have **{game.lives} lives** left."
+        if game.finished: 
             st.session_state.gameover_feedback = f'''**GAME OVER**: You ran out of lives! Please start a new game.
-                                                      \n\nThe correct answer was **{st.session_state.correct_song}**, {st.session_state.correct_section}, from the album **{st.session_state.correct_album}**.'''
+                                                      \n\nThe correct answer was **{game.current.track_name}**, {game.current.section}, from the album **{game.current.album_name}**.'''
             st.session_state.giveup_feedback = ""
             end_game()
             return
 
+@callback
 def end_game():
-    # if the game is ended before an answer is provided, count it as incorrect
-    if len(st.session_state.round_results) != st.session_state.round_count: 
-        st.session_state.round_results.append(False)
-        correct_album_short = ALBUMS_MAPPING[st.session_state.correct_album]
-        st.session_state.album_counter[correct_album_short].append(False)
-
-    accuracy_pct = round((sum(st.session_state.round_results) * 100 /st.session_state.round_count), 2)
-    possible_pct = round(st.session_state.points * 100 / (st.session_state.round_count * POINTS_MAPPING[st.session_state.difficulty]), 2)
-    accuracy_str = f"{sum(st.session_state.round_results)}/{st.session_state.round_count} ({accuracy_pct}%)"
-    possible_str = f"{st.session_state.points}/{st.session_state.round_count * POINTS_MAPPING[st.session_state.difficulty]} ({possible_pct}%)"
-
-    accs = {album: (round(sum(ls) * 100/len(ls), 2), sum(ls), len(ls)) 
-            if len(ls) else (0.0, 0, 0) for album, ls in st.session_state.album_counter.items()}
-    st.session_state.album_accs = dict(sorted(accs.items(), 
-                                       key=lambda x: (x[1][0], x[1][2], x[1][1]),
-                                       reverse=True))
-    st.session_state.enable_leaderboard = True if ((st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)") and
-                                                   (len(st.session_state.albums) == len(ALL_ALBUMS)) and
-                                                   (st.session_state.round_count >= 5)) else False
-    
+    game = st.session_state.game
+    # if the game is ended before an answer is provided, the round counts as incorrect
+    if not game.finished: 
+        game.end()
+
+    accuracy_pct = round((sum(game.round_results) * 100 / game.round_count), 2)
+    possible_pct = round(game.points * 100 / game.possible_points, 2)
+    accuracy_str = f"{sum(game.round_results)}/{game.round_count} ({accuracy_pct}%)"
+    possible_str = f"{game.points}/{game.possible_points} ({possible_pct}%)"
+
+    st.session_state.album_accs = {ALBUMS_MAPPING[album]: acc for album, acc in game.album_accuracies().items()}
+    st.session_state.enable_leaderboard = game.survival and game.albums is None and game.round_count >= 5
     
     st.session_state.past_game_stats = f"""
-{DIFFICULTY_MAPPING[st.session_state.difficulty]} difficulty, {MODE_MAPPING[st.session_state.game_mode]} mode, {st.session_state.round_count} rounds played
+{DIFFICULTY_MAPPING[game.difficulty]} difficulty, {MODE_MAPPING[st.session_state.game_mode]} mode, {game.round_count} rounds played
 * :dart: Accuracy: {accuracy_str}
 * :100: Points out of total possible: {possible_str}
-* :bulb: Hints used: {st.session_state.hints_used}
-* :fire: Max streak: {max(st.session_state.streaks) if len(st.session_state.streaks) else 0}
-* :moneybag: Total points: {st.session_state.points}
+* :bulb: Hints used: {game.hints_used}
+* :fire: Max streak: {game.max_streak}
+* :moneybag: Total points: {game.points}
 """
-    
-    st.session_state.game_in_progress = False
 
+@callback
 def name_submitted():
     
     st.session_state.disable_name_input = True
-    # st.session_state.submitted_datetime = strftime("%Y-%m-%d %H:%M:%S", gmtime())
-    utc_time = datetime.utcnow()
-    eastern = pytz.timezone("US/Eastern")
-    eastern_time = utc_time.replace(tzinfo=pytz.utc).astimezone(eastern)
-    st.session_state.submitted_datetime = eastern_time.strftime("%Y-%m-%d %H:%M:%S")
 
     game_results = (st.session_state.leaderboard_name,
-                    st.session_state.points,
-                    st.session_state.round_count,
-                    st.session_state.submitted_datetime)
+                    st.session_state.game.points,
+                    st.session_state.game.round_count,
+                    int(time.time()))
     
     # clear the name input text box
     st.session_state.name = st.session_state.leaderboard_name
     st.session_state.leaderboard_name = ""
 
+    # written in the background; see resolve_submission
+    st.session_state.submission = get_writer().submit(st.session_state.difficulty, game_results)
+
+@callback
+def resolve_submission():
+    """Reports the submitted results' rank once they are written (without waiting for them), or the error if the write failed"""
+    submission = st.session_state.submission
+    if submission is None: 
+        return
+    if not submission.done():
+        st.session_state.rank_msg = "*Submitting your results...*"
+        return
+    # cleared first, so that a failed write is only reported once
+    st.session_state.submission = None
+    error = submission.exception()
+    if error is not None:
+        st.session_state.rank_msg = ""
+        st.session_state.submission_error = f"Your game results could not be added to the leaderboard ({error}). Please try again."
+        st.session_state.disable_name_input = False
+        return
+    st.session_state.submitted_id, added_rank = submission.result()
     with Leaderboards() as leaderboard:
-        leaderboard.add_to_leaderboard(st.session_state.difficulty, game_results)
-        current_leaderboards = leaderboard.get_leaderboards()
-
-    added_to_df = current_leaderboards[st.session_state.difficulty]
-    filtered_row = added_to_df[added_to_df["Datetime (EST)"].astype(str) == str(st.session_state.submitted_datetime)]
-    added_rank = int(filtered_row.index[0])
-    out_of = added_to_df.shape[0]
+        stats = leaderboard.get_score_stats(st.session_state.difficulty, st.session_state.game.points)
 
-    st.session_state.rank_msg = f"Your game results were added to the leaderboard!\nYou ranked in position {added_rank} out of {out_of} total results."
+    st.session_state.rank_msg = (f"Your game results were added to the leaderboard!\nYou ranked in position {added_rank} out of {stats.total} total results. "
+                                 f"You scored more points than {stats.percentile:.0f}% of players, and {stats.beat_you} scored more than you.")
 
-
-def highlight_new_row(row):
-    """Highlights the row that was just added to the leaderboard in green"""
-    if str(row["Datetime (EST)"]) == str(st.session_state.submitted_datetime):
+def show_submission_status():
+    """Shows the submitted results' rank (or the error); while they are being written, this reruns on its own (as a fragment), and reruns the whole page once they are, so the leaderboard shows them"""
+    if st.session_state.submission is not None:
+        resolve_submission()
+        if st.session_state.submission is None:
+            st.rerun()
+    st.markdown(st.session_state.rank_msg)
+    if st.session_state.submission_error:
+        st.error(st.session_state.submission_error, icon="🚨")
+        st.session_state.submission_error = ""
+
+def highlight_new_row(row, rank=None):
+    """Highlights the row that was just added to the leaderboard (at the given rank) in green"""
+    if row.name == rank:
         return ['background-color: #4D6D4D'] * len(row)
     else:
         return [''] * len(row)
     
-def get_database(path="leaderboard.db"):
-    with open(path, "rb") as f:
-        return f.read()
+@callback
+def prepare_export():
+    """Snapshots the leaderboard database to a temporary file for download; only done when requested"""
+    compress = st.session_state.compress_export
+    remove_stale_exports()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".db.gz" if compress else ".db")
+    # streamed to disk, so the snapshot is never held in memory
+    with os.fdopen(fd, "wb") as f, Leaderboards() as leaderboard:
+        for chunk in leaderboard.iter_export(compress=compress):
+            f.write(chunk)
+    st.session_state.export = {"path": path,
+                               "file_name": "leaderboard.db.gz" if compress else "leaderboard.db",
+                               "created": time.time()}
+
+@callback
+def clear_export():
+    """Deletes the snapshot once it has been downloaded (or has expired)"""
+    if st.session_state.export is not None:
+        try:
+            os.remove(st.session_state.export["path"])
+        except FileNotFoundError:
+            pass
+        st.session_state.export = None
+
+def remove_stale_exports():
+    """Deletes the snapshots of sessions that left without downloading them"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if time.time() - entry.stat().st_mtime > EXPORT_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
 
 ### UI ###
 with st.sidebar:
@@ -534,11 +528,23 @@ with st.sidebar:
 
         st.divider()
 
-        db = get_database()
-        st.download_button(label="Download leaderboard",
-                        data=db,
-                        file_name="leaderboard.db",
-                        mime="application/octet-stream")
+        # the download is offered until it is clicked, or until the snapshot
+        # expires (when another session may already have deleted it)
+        export = st.session_state.export
+        if export is not None and (time.time() - export["created"] > EXPORT_TTL or not os.path.exists(export["path"])):
+            clear_export()
+
+        if st.session_state.export is None:
+            st.checkbox("Compress (gzip)", key="compress_export")
+            st.button("Prepare leaderboard download", on_click=prepare_export)
+        else:
+            with open(export["path"], "rb") as f:
+                data = f.read()
+            st.download_button(label="Download leaderboard",
+                            data=data,
+                            file_name=export["file_name"],
+                            mime="application/gzip" if export["file_name"].endswith(".gz") else "application/octet-stream",
+                            on_click=clear_export)
 
 
 buffer1, main_col, buffer2 = st.columns([1, 3, 1])
@@ -548,7 +554,8 @@ with main_col:
     #             unsafe_allow_html=True)
     # st.markdown(f"*Similar artists: Olivia Rodrigo, Sabrina Carpenter*")
     st.markdown(f"*The Life of a Showgirl lyrics will be added as soon as they are available :)*")
-    if st.session_state.game_in_progress == False: 
+    game_in_progress = st.session_state.game is not None and not st.session_state.game.finished
+    if not game_in_progress: 
 
         start_tab, past_stats_tab, leaderboard_tab = st.tabs(["Start New Game", "Stats", "Leaderboard"])
 
@@ -610,28 +617,44 @@ with main_col:
                 st.markdown("#### You must start a game before viewing past game statistics!")
 
         with leaderboard_tab: 
+            resolve_submission()
             st.markdown("### Leaderboards")
             if st.session_state.enable_leaderboard:
                 with st.popover(f"Add your results to the leaderboard"):
                     st.markdown("#### Add your results")
-                    st.markdown(f"Points: {st.session_state.points}")
+                    st.markdown(f"Points: {st.session_state.game.points}")
                     st.text_input("Enter your name",
                                 key="leaderboard_name",
                                 disabled=st.session_state.disable_name_input,
                                 on_change=name_submitted)
-                st.markdown(st.session_state.rank_msg)
+                # only polls while a submission is pending
+                st.fragment(show_submission_status, 
+                            run_every=SUBMISSION_POLL_INTERVAL if st.session_state.submission is not None else None)()
             else: 
                 st.markdown(f"Your game results can only be added to the leaderboard if you played 5+ rounds in Survival mode with all albums enabled.")
 
-            with Leaderboards() as leaderboard:
-                current_leaderboards = leaderboard.get_leaderboards()
-            
             leaderboard_to_show = st.selectbox("Select leaderboard to display",
                                             options=DIFFICULTIES,
                                             index=DIFFICULTIES.index(st.session_state.difficulty) if st.session_state.difficulty else 0)
-            shown_leaderboard = current_leaderboards[leaderboard_to_show]
-            shown_leaderboard = shown_leaderboard.style.apply(highlight_new_row, axis=1)
-            st.markdown(f"### {DIFFICULTY_MAPPING[leaderboard_to_show]} Leaderboard")
+            window_to_show = st.selectbox("Select time window", options=WINDOWS)
+            since = window_start(window_to_show)
+            # only the page being shown is read from the database
+            with Leaderboards() as leaderboard:
+                # the submitted results' current rank (ranks shift as others submit)
+                submitted_rank = None
+                if st.session_state.submitted_id is not None and leaderboard_to_show == st.session_state.difficulty:
+                    submitted_rank = leaderboard.get_rank(leaderboard_to_show, st.session_state.submitted_id, since)
+                num_pages = max(1, math.ceil(leaderboard.count_entries(leaderboard_to_show, since) / LEADERBOARD_PAGE_SIZE))
+                # start on the page with the submitted results, if any
+                default_page = (submitted_rank - 1) // LEADERBOARD_PAGE_SIZE + 1 if submitted_rank else 1
+                page = st.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, 
+                                       value=min(default_page, num_pages), step=1)
+                shown_leaderboard = leaderboard.get_leaderboard(leaderboard_to_show, 
+                                                                limit=LEADERBOARD_PAGE_SIZE, 
+                                                                offset=(page - 1) * LEADERBOARD_PAGE_SIZE, 
+                                                                since=since)
+            shown_leaderboard = shown_leaderboard.style.apply(highlight_new_row, axis=1, rank=submitted_rank)
+            st.markdown(f"### {DIFFICULTY_MAPPING[leaderboard_to_show]} Leaderboard ({window_to_show})")
             st.table(shown_leaderboard) #, use_container_width=True)
 
     if st.session_state.start_btn_clicked:
@@ -640,32 +663,26 @@ with main_col:
         st.session_state.start_btn_clicked = False
         st.rerun()
 
-    if st.session_state.game_in_progress == True: 
+    if game_in_progress: 
+        game = st.session_state.game
         with st.container(border=True):
             game_tab, stats_tab = st.tabs(["Game", "Current Game Statistics"])
             with game_tab:
-                st.write(f"<h4><u>Round {st.session_state.round_count}<u/></h4>", unsafe_allow_html=True)
-                st.write(st.session_state.generated_lyrics, unsafe_allow_html=True)
+                st.write(f"<h4><u>Round {game.round_count}<u/></h4>", unsafe_allow_html=True)
+                st.write(f'<div class="lyrics">{game.current.lyrics}</div>', unsafe_allow_html=True)
                 st.text("")
                 st.text_input("Enter your guess",
                             placeholder="e.g. Back to December or Shake it Off",
                             key="temp_guess",
                             on_change=clear_guess,
-                            disabled=st.session_state.disable_buttons)
+                            disabled=game.round_over)
                 if st.session_state.guess: 
-                    if st.session_state.lyrics.get_guess_feedback(st.session_state.guess,
-                                                                  acceptable_answers=ACCEPTABLE_ANSWERS,
-                                                                  remove_parentheses=True,
-                                                                  keep_parentheses=KEEP_PARENTHESES): 
-                        answered_correctly()
-                    else: 
-                        answered_incorrectly()
+                    check_guess()
                 
-                if not st.session_state.hide_buttons:
+                if not game.round_over:
                     col1, col2, col3, col4 = st.columns([1.5, 3, 1, 1])
-                    hint_btn = col1.button(":bulb: Hint", on_click=hint, disabled=st.session_state.disable_hint_btn)
-                    giveup_btn = col2.button(":no_entry: Give up", on_click=giveup, 
-                                            disabled=st.session_state.disable_buttons)
+                    hint_btn = col1.button(":bulb: Hint", on_click=hint, disabled=not game.can_hint())
+                    giveup_btn = col2.button(":no_entry: Give up", on_click=giveup)
                 
                 if st.session_state.hint_feedback:
                     st.info(f"{st.session_state.hint_feedback}", icon="ℹ️")
@@ -686,20 +703,28 @@ with main_col:
 
             with stats_tab:
                 st.markdown(f"### In-Game Statistics")
-                st.markdown(f"**{DIFFICULTY_MAPPING[st.session_state.difficulty]} difficulty, {MODE_MAPPING[st.session_state.game_mode]} mode**")
-                st.markdown(f"* 🟢 Round: {st.session_state.round_count}")
-
-                accuracy_pct = round((sum(st.session_state.round_results) * 100 /st.session_state.round_count), 2)
-                possible_pct = round(st.session_state.points * 100 / (st.session_state.round_count * POINTS_MAPPING[st.session_state.difficulty]), 2)
-                accuracy_str = f"{sum(st.session_state.round_results)}/{st.session_state.round_count} ({accuracy_pct}%)"
-                possible_str = f"{st.session_state.points}/{st.session_state.round_count * POINTS_MAPPING[st.session_state.difficulty]} ({possible_pct}%)"
-                stats_remainder = f" ({st.session_state.hints_limit - st.session_state.hints_used} hints remaining)" if st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)" else ""
+                st.markdown(f"**{DIFFICULTY_MAPPING[game.difficulty]} difficulty, {MODE_MAPPING[st.session_state.game_mode]} mode**")
+                st.markdown(f"* 🟢 Round: {game.round_count}")
+
+                accuracy_pct = round((sum(game.round_results) * 100 / game.round_count), 2)
+                possible_pct = round(game.points * 100 / game.possible_points, 2)
+                accuracy_str = f"{sum(game.round_results)}/{game.round_count} ({accuracy_pct}%)"
+                possible_str = f"{game.points}/{game.possible_points} ({possible_pct}%)"
+                stats_remainder = f" ({game.hints_remaining} hints remaining)" if game.survival else ""
                 
                 st.markdown(f"* :dart: Accuracy: {accuracy_str}")
                 st.markdown(f"* :100: Points out of total possible: {possible_str}")
-                st.markdown(f"* :fire: Current streak: {st.session_state.streak}")
+                st.markdown(f"* :fire: Current streak: {game.streak}")
         
-                st.markdown(f"* :bulb: Hints used: {st.session_state.hints_used}{stats_remainder}")
-                st.markdown(f"* :moneybag: Total points: {st.session_state.points}")
-                if st.session_state.game_mode == f"Survival (with 5 lives, {HINTS_LIMIT} hints)":
-                    st.markdown(f"* :space_invader: Lives: {st.session_state.lives}")
\ No newline at end of file
+                st.markdown(f"* :bulb: Hints used: {game.hints_used}{stats_remainder}")
+                st.markdown(f"* :moneybag: Total points: {game.points}")
+                if game.survival:
+                    st.markdown(f"* :space_invader: Lives: {game.lives}")
+
+### TIMING ###
+if TIMING_ENABLED:
+    get_histogram("rerun").observe(time.perf_counter() - RERUN_START)
+    with st.sidebar.expander("⏱️ Timings (ms)"):
+        st.code(timing_report())
+if st.session_state.profiler is not None:
+    st.session_state.profiler.end_rerun()
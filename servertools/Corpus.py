@@ -0,0 +1,507 @@
+import os
+import sys
+import json
+import mmap
+import bisect
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from servertools.Metrics import CORPUS_LOAD_SECONDS
+from servertools.Timing import timed
+
+# layout of a compiled corpus: MAGIC, then the format version and the header
+# length (both uint32), then a JSON header describing the string tables and the
+# position of every array within the data section that follows it
+MAGIC = b"TAYLYRC\x00"
+FORMAT_VERSION = 2
+_PREAMBLE = np.dtype([("version", "<u4"), ("header_length", "<u4")])
+_ALIGNMENT = 8
+
+# common English stop words, used to judge how "generic" a lyric is
+STOP_WORDS = frozenset("""a about after all am an and any are as at be been but by can could did do 
+    does don't for from had has have he her him his how i i'm if in into is it it's just like me 
+    my no not now of oh on or our out she so that the their them then there they this to too up 
+    us was we were what when where who will with would yeah you you're your""".split())
+_PUNCTUATION = "\"'()[],.!?;:-‘’“”"
+
+# corpora shared by every session in the process, keyed by their source path
+_SHARED_CORPORA: Dict[str, "Corpus"] = {}
+_SHARED_CORPORA_LOCK = threading.Lock()
+
+def _run_bounds(breaks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Given a boolean array marking the rows that begin a new run (e.g. a new
+    song or section), returns the first and last row of the run each row
+    belongs to.
+    """
+    run_starts = np.flatnonzero(breaks)
+    run_ends = np.append(run_starts[1:] - 1, len(breaks) - 1)
+    run_ids = np.cumsum(breaks) - 1
+    return run_starts[run_ids].astype(np.int32), run_ends[run_ids].astype(np.int32)
+
+def _encode(column: pd.Series) -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Integer-codes a categorical column, returning the codes and the table of
+    (interned) strings they index into.
+    """
+    codes, uniques = pd.factorize(column, sort=False)
+    table = tuple(sys.intern(str(value)) for value in uniques)
+    dtype = np.int16 if len(table) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype), table
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+class Eligibility(NamedTuple): 
+    """
+    A rule deciding which prompts may be generated, judged on the lyrics the
+    prompt shows (e.g. the whole section in Easy mode).
+
+    Args:
+        min_words: 
+            The minimum number of words (as counted by lyric.split(" "))
+
+        max_stopword_ratio: 
+            The maximum fraction of those words that may be stop words
+    """
+    min_words: int = 1
+    max_stopword_ratio: float = 1.0
+
+class Corpus():
+    """
+    Class that stores an artist's lyrics in a compact, columnar form.
+
+    The track, album and section (element) columns are stored as integer
+    codes into a table of strings, and all lyrics are stored in a single
+    UTF-8 buffer, with the lyric of row i spanning
+    lyric_offsets[i]:lyric_offsets[i + 1].
+
+    Args:
+        track_codes, album_codes, element_codes:
+            Integer arrays giving, per row, the index into the corresponding
+            string table
+
+        track_names, album_names, elements:
+            The string tables for each of the categorical columns
+
+        lyric_buffer:
+            The UTF-8 encoded lyrics of every row, concatenated
+
+        lyric_offsets:
+            An array of len(rows) + 1 byte offsets into lyric_buffer
+
+        indexes:
+            Optional parameter containing the precomputed row indexes (see
+            INDEX_NAMES), e.g. when loading a compiled corpus; they are 
+            computed from the other columns if not given
+    """
+    INDEX_NAMES = ("song_start", "song_end", "section_start", "section_end", 
+                   "word_counts", "stopword_counts")
+
+    def __init__(self,
+                 track_codes: np.ndarray,
+                 album_codes: np.ndarray,
+                 element_codes: np.ndarray,
+                 track_names: Tuple[str, ...],
+                 album_names: Tuple[str, ...],
+                 elements: Tuple[str, ...],
+                 lyric_buffer: bytes,
+                 lyric_offsets: np.ndarray,
+                 indexes: Optional[Dict[str, np.ndarray]]=None):
+        """Constructor"""
+
+        self.track_codes = track_codes
+        self.album_codes = album_codes
+        self.element_codes = element_codes
+        self.track_names = track_names
+        self.album_names = album_names
+        self.elements = elements
+        self.lyric_buffer = lyric_buffer
+        self.lyric_offsets = lyric_offsets
+
+        if indexes is None: 
+            indexes = self.build_indexes()
+        self.song_start = indexes["song_start"]
+        self.song_end = indexes["song_end"]
+        self.section_start = indexes["section_start"]
+        self.section_end = indexes["section_end"]
+        self.word_counts = indexes["word_counts"]
+        self.stopword_counts = indexes["stopword_counts"]
+
+        # a corpus is shared between sessions (and threads), so it is made
+        # read-only once built
+        for array in self.arrays().values():
+            array.setflags(write=False)
+
+        # albums are stored in (mostly) contiguous blocks; each album maps to 
+        # the [start, stop) row ranges it occupies
+        album_breaks = np.flatnonzero(np.diff(album_codes)) + 1
+        run_starts = np.concatenate([[0], album_breaks]).astype(int)
+        run_stops = np.append(album_breaks, len(album_codes)).astype(int)
+        self.album_ranges: Dict[str, List[Tuple[int, int]]] = {album: [] for album in album_names}
+        for start, stop in zip(run_starts.tolist(), run_stops.tolist()):
+            self.album_ranges[album_names[album_codes[start]]].append((start, stop))
+
+        # the (sorted) rows that each kind of prompt can be generated from, 
+        # such that every row yields a distinct prompt
+        rows = np.arange(len(self), dtype=np.int32)
+        single_line_songs = self.song_start == self.song_end
+        self.prompt_rows: Dict[str, np.ndarray] = {
+            "sections": np.flatnonzero(self.section_start == rows),
+            "line_pairs": np.flatnonzero((rows < self.song_end) | single_line_songs),
+            "lines": rows}
+        # prompt rows filtered by an eligibility rule, keyed by (kind, rule) 
+        self._eligible_rows: Dict[Tuple[str, Eligibility], np.ndarray] = {}
+        self._eligible_rows_lock = threading.Lock()
+
+    def build_indexes(self) -> Dict[str, np.ndarray]:
+        """
+        Computes the row indexes from the corpus' columns. Row boundaries are 
+        precomputed once so that every lyric window can be found by indexing
+        rather than walking the rows one by one.
+
+        Returns:
+            A dictionary mapping each of INDEX_NAMES to its array.
+        """
+        song_breaks = np.ones(len(self.track_codes), dtype=bool)
+        song_breaks[1:] = ((self.track_codes[1:] != self.track_codes[:-1])
+                           | (self.album_codes[1:] != self.album_codes[:-1]))
+        section_breaks = song_breaks.copy()
+        section_breaks[1:] |= self.element_codes[1:] != self.element_codes[:-1]
+        song_start, song_end = _run_bounds(song_breaks)
+        section_start, section_end = _run_bounds(section_breaks)
+
+        # words are counted the way the game always has, i.e. lyric.split(" ")
+        spaces = np.zeros(len(self.lyric_buffer) + 1, dtype=np.int32)
+        np.cumsum(np.frombuffer(self.lyric_buffer, dtype=np.uint8) == ord(" "), out=spaces[1:])
+        word_counts = (spaces[self.lyric_offsets[1:]] - spaces[self.lyric_offsets[:-1]] + 1).astype(np.int16)
+        stopword_counts = np.array([sum(word.strip(_PUNCTUATION) in STOP_WORDS for word in self.lyric(row).lower().split(" "))
+                                    for row in range(len(self))], dtype=np.int16)
+
+        return {"song_start": song_start, "song_end": song_end, 
+                "section_start": section_start, "section_end": section_end, 
+                "word_counts": word_counts, "stopword_counts": stopword_counts}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns every array held by the corpus (columns and indexes) by name.
+        """
+        columns = {"track_codes": self.track_codes, 
+                   "album_codes": self.album_codes, 
+                   "element_codes": self.element_codes, 
+                   "lyric_offsets": self.lyric_offsets}
+        return {**columns, **{name: getattr(self, name) for name in self.INDEX_NAMES}}
+
+    def prompt_windows(self, kind: str, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]: 
+        """
+        Returns the first and last line of the prompts of a given kind (see 
+        prompt_rows) generated from each of the given rows.
+        """
+        if kind == "lines": 
+            return rows, rows
+        
+        if kind == "line_pairs": 
+            # give the next line if it is from the same song; if not, give the previous line
+            has_next = rows < self.song_end[rows]
+            return (np.where(has_next, rows, np.maximum(rows - 1, self.song_start[rows])),
+                    np.where(has_next, rows + 1, rows))
+        
+        # the whole section (within the same song) the line belongs to
+        return self.section_start[rows], self.section_end[rows]
+
+    def eligible_rows(self, kind: str, rule: Optional[Eligibility]=None) -> np.ndarray: 
+        """
+        Returns the (sorted) rows of the prompts of a given kind that satisfy
+        an eligibility rule. Each rule is evaluated over the whole corpus once,
+        after which the array is cached.
+
+        Args:
+            kind: 
+                The kind of prompt (see prompt_rows)
+
+            rule: 
+                Optional parameter specifying the eligibility rule; all prompts
+                are eligible if not given
+        """
+        if rule is None: 
+            return self.prompt_rows[kind]
+        key = (kind, rule)
+        eligible = self._eligible_rows.get(key)
+        if eligible is None: 
+            with self._eligible_rows_lock: 
+                eligible = self._eligible_rows.get(key)
+                if eligible is None: 
+                    rows = self.prompt_rows[kind]
+                    start_lines, end_lines = self.prompt_windows(kind, rows)
+                    # word totals of each prompt, from cumulative sums over the lines
+                    words = np.concatenate([[0], np.cumsum(self.word_counts, dtype=np.int64)])
+                    stopwords = np.concatenate([[0], np.cumsum(self.stopword_counts, dtype=np.int64)])
+                    prompt_words = words[end_lines + 1] - words[start_lines]
+                    prompt_stopwords = stopwords[end_lines + 1] - stopwords[start_lines]
+                    eligible = rows[(prompt_words >= rule.min_words)
+                                    & (prompt_stopwords <= rule.max_stopword_ratio * prompt_words)]
+                    eligible.setflags(write=False)
+                    self._eligible_rows[key] = eligible
+        return eligible
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame) -> "Corpus":
+        """
+        Builds a corpus from a dataframe with track_name, album_name, element
+        and lyric columns (i.e., the format of the lyrics CSV).
+        """
+        track_codes, track_names = _encode(data["track_name"])
+        album_codes, album_names = _encode(data["album_name"])
+        element_codes, elements = _encode(data["element"])
+
+        encoded = [str(lyric).encode("utf-8") for lyric in data["lyric"]]
+        lyric_offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+        np.cumsum([len(lyric) for lyric in encoded], out=lyric_offsets[1:])
+
+        return cls(track_codes, album_codes, element_codes,
+                   track_names, album_names, elements,
+                   b"".join(encoded), lyric_offsets)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Corpus":
+        """
+        Builds a corpus from a lyrics CSV.
+        """
+        return cls.from_dataframe(pd.read_csv(path))
+
+    @classmethod
+    def from_compiled(cls, path: str) -> "Corpus":
+        """
+        Loads a corpus compiled by Corpus.compile. The file is memory-mapped
+        rather than read, so its arrays are views onto pages that are shared 
+        (through the OS page cache) by every process that loads it.
+
+        Raises:
+            ValueError: If the file is not a compiled corpus, or was compiled
+                        with a different format version.
+        """
+        with open(path, "rb") as f: 
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if buffer[:len(MAGIC)] != MAGIC: 
+            raise ValueError(f"{path} is not a compiled corpus")
+        preamble = np.frombuffer(buffer, dtype=_PREAMBLE, count=1, offset=len(MAGIC))[0]
+        if preamble["version"] != FORMAT_VERSION: 
+            raise ValueError(f"{path} has format version {preamble['version']}, expected {FORMAT_VERSION}")
+        header_start = len(MAGIC) + _PREAMBLE.itemsize
+        header = json.loads(buffer[header_start:header_start + preamble["header_length"]])
+        data_start = _aligned(header_start + int(preamble["header_length"]))
+
+        arrays = {name: np.frombuffer(buffer, dtype=section["dtype"], count=section["count"], 
+                                      offset=data_start + section["offset"])
+                  for name, section in header["arrays"].items()}
+        buffer_start = data_start + header["lyric_buffer"]["offset"]
+        lyric_buffer = memoryview(buffer)[buffer_start:buffer_start + header["lyric_buffer"]["count"]]
+
+        return cls(arrays["track_codes"], arrays["album_codes"], arrays["element_codes"],
+                   *(tuple(sys.intern(s) for s in header["tables"][table]) 
+                     for table in ["track_names", "album_names", "elements"]),
+                   lyric_buffer, arrays["lyric_offsets"],
+                   indexes={name: arrays[name] for name in cls.INDEX_NAMES})
+
+    def compile(self, path: str):
+        """
+        Writes the corpus (string tables, lyrics, offsets and precomputed 
+        indexes) to a versioned binary file that can be loaded with 
+        Corpus.from_compiled. The file is written atomically, so processes
+        loading it never see a partial file.
+        """
+        sections = {}
+        offset = 0
+        for name, array in self.arrays().items(): 
+            sections[name] = {"dtype": array.dtype.str, "offset": offset, "count": len(array)}
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({"rows": len(self),
+                             "tables": {"track_names": self.track_names,
+                                        "album_names": self.album_names, 
+                                        "elements": self.elements},
+                             "arrays": sections,
+                             "lyric_buffer": {"offset": offset, "count": len(self.lyric_buffer)}}).encode("utf-8")
+        preamble = np.array([(FORMAT_VERSION, len(header))], dtype=_PREAMBLE)
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC + preamble.tobytes() + header)
+            data_start = _aligned(f.tell())
+            for name, array in self.arrays().items(): 
+                f.seek(data_start + sections[name]["offset"])
+                f.write(array.tobytes())
+            f.seek(data_start + offset)
+            f.write(self.lyric_buffer)
+        os.replace(temp_path, path)
+
+    def __len__(self) -> int:
+        return len(self.track_codes)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The approximate number of bytes held by the corpus' arrays, buffer
+        and string tables.
+        """
+        tables = [self.track_names, self.album_names, self.elements]
+        return (sum(array.nbytes for array in self.arrays().values())
+                + len(self.lyric_buffer)
+                + sum(sys.getsizeof(s) for table in tables for s in table))
+
+    def lyric(self, row: int) -> str:
+        """
+        Returns the lyric of a given row.
+        """
+        return str(self.lyric_buffer[self.lyric_offsets[row]:self.lyric_offsets[row + 1]], "utf-8")
+
+    def lyrics(self, start: int, end: int) -> List[str]:
+        """
+        Returns the lyrics of rows start through end (inclusive).
+        """
+        return [self.lyric(row) for row in range(start, end + 1)]
+
+    def track_name(self, row: int) -> str:
+        """
+        Returns the track name of a given row.
+        """
+        return self.track_names[self.track_codes[row]]
+
+    def album_name(self, row: int) -> str:
+        """
+        Returns the album name of a given row.
+        """
+        return self.album_names[self.album_codes[row]]
+
+    def element(self, row: int) -> str:
+        """
+        Returns the section (e.g. Chorus, Verse 1) of a given row.
+        """
+        return self.elements[self.element_codes[row]]
+
+class AlbumView(): 
+    """
+    Class that presents the rows of a subset of a corpus' albums as a single
+    sequence, without copying any of the corpus' data. Rows are referred to by
+    their index in the underlying corpus.
+
+    Args:
+        corpus: 
+            The corpus to view
+
+        album_names: 
+            Optional parameter specifying the albums to include; all albums 
+            are included if not given
+
+        eligible: 
+            Optional parameter specifying a sorted array of corpus rows (e.g. 
+            one of Corpus.prompt_rows) to restrict the view to; all rows are
+            included if not given
+    """
+    __slots__ = ("eligible", "ranges", "cumulative", "size")
+
+    def __init__(self, corpus: Corpus, album_names: Optional[List[str]]=None, 
+                 eligible: Optional[np.ndarray]=None):
+        """Constructor"""
+
+        if album_names is None: 
+            album_names = corpus.album_names
+        self.eligible = eligible
+        # the albums' row ranges, as ranges of positions in eligible if given
+        self.ranges = sorted(row_range for album in album_names 
+                             for row_range in corpus.album_ranges[album])
+        if eligible is not None: 
+            self.ranges = [(int(np.searchsorted(eligible, start)), int(np.searchsorted(eligible, stop))) 
+                           for start, stop in self.ranges]
+        # cumulative[i] is the number of rows in the view before ranges[i]
+        self.cumulative = []
+        self.size = 0
+        for start, stop in self.ranges: 
+            self.cumulative.append(self.size)
+            self.size += stop - start
+
+    def __len__(self) -> int:
+        return self.size
+
+    def row(self, position: int) -> int:
+        """
+        Returns the corpus row at a given position of the view.
+        """
+        i = bisect.bisect_right(self.cumulative, position) - 1
+        row = self.ranges[i][0] + position - self.cumulative[i]
+        return int(self.eligible[row]) if self.eligible is not None else row
+
+    def rows(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Returns the corpus rows at an array of positions of the view.
+        """
+        i = np.searchsorted(self.cumulative, positions, side="right") - 1
+        starts = np.array([start for start, _ in self.ranges])
+        rows = starts[i] + positions - np.asarray(self.cumulative)[i]
+        return self.eligible[rows] if self.eligible is not None else rows
+
+def compiled_path(path: str) -> str:
+    """
+    Returns the default path of the compiled version of a lyrics CSV.
+    """
+    return os.path.splitext(path)[0] + ".corpus"
+
+@timed
+def load_corpus(path: str) -> Corpus:
+    """
+    Loads the corpus for the lyrics CSV at the given path. The compiled 
+    version of the CSV is used if it exists, is up to date (i.e., not older
+    than the CSV) and has the current format version; otherwise the CSV is
+    parsed.
+
+    Args:
+        path: The path to the lyrics CSV.
+
+    Returns:
+        The loaded Corpus.
+    """
+    compiled = compiled_path(path)
+    with CORPUS_LOAD_SECONDS.time(): 
+        if (os.path.exists(compiled) 
+            and (not os.path.exists(path) or os.path.getmtime(compiled) >= os.path.getmtime(path))):
+            try: 
+                return Corpus.from_compiled(compiled)
+            except ValueError: 
+                pass
+        return Corpus.from_csv(path)
+
+def load_shared_corpus(path: str) -> Corpus:
+    """
+    Returns the process-wide corpus for the lyrics CSV at the given path 
+    (see load_corpus), loading it on first use. The corpus is read-only, so the same 
+    instance can safely be handed to every session and thread.
+
+    Args:
+        path: The path to the lyrics CSV.
+
+    Returns:
+        The shared Corpus.
+    """
+    key = os.path.abspath(path)
+    corpus = _SHARED_CORPORA.get(key)
+    if corpus is None:
+        with _SHARED_CORPORA_LOCK:
+            # another thread may have loaded it while we waited on the lock
+            corpus = _SHARED_CORPORA.get(key)
+            if corpus is None:
+                corpus = load_corpus(path)
+                _SHARED_CORPORA[key] = corpus
+    return corpus
+
+if __name__ == "__main__": 
+    parser = argparse.ArgumentParser(description="Compiles a lyrics CSV into a binary corpus file.")
+    parser.add_argument("csv", help="path to the lyrics CSV")
+    parser.add_argument("-o", "--output", help="path of the compiled corpus (default: the CSV path with a .corpus extension)")
+    args = parser.parse_args()
+
+    output = args.output or compiled_path(args.csv)
+    Corpus.from_csv(args.csv).compile(output)
+    print(f"Compiled {args.csv} to {output}")
@@ -0,0 +1,156 @@
+import os
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# how long (in seconds) a connection waits on another connection's write lock
+# before raising "database is locked"
+BUSY_TIMEOUT = 10.0
+
+_POOLS: Dict[str, "ConnectionPool"] = {}
+_POOLS_LOCK = threading.Lock()
+
+class ConnectionPool():
+    """
+    Class that hands out reusable connections to a SQLite database. Each
+    connection is opened once, in WAL mode, and returned to the pool after
+    use rather than closed. In WAL mode, readers never wait on the writer
+    (and vice versa); writers wait on each other for up to busy_timeout
+    seconds instead of failing immediately.
+
+    Args:
+        db_path:
+            The path to the database
+
+        setup:
+            Optional parameter specifying a function that is called with
+            the first connection opened (e.g. to create the schema); it runs
+            once per pool
+
+        max_idle:
+            The maximum number of idle connections kept open; connections
+            released beyond this are closed
+
+        busy_timeout:
+            The number of seconds a write waits for another write to finish
+    """
+    def __init__(self, db_path: str, setup: Optional[Callable[[sqlite3.Connection], None]]=None,
+                 max_idle: int=8, busy_timeout: float=BUSY_TIMEOUT):
+        """Constructor"""
+
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self.idle = queue.LifoQueue()
+        # incremented after every committed write; cached results computed
+        # at an older version are stale
+        self.version = 0
+        self.cache: Dict[Hashable, tuple] = {}
+        # the data_version each connection last saw (see cached)
+        self.data_versions: Dict[sqlite3.Connection, int] = {}
+        self._version_lock = threading.Lock()
+
+        connection = self._connect()
+        if setup is not None:
+            setup(connection)
+        self.idle.put(connection)
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections are only ever used by one thread at a time, but not
+        # necessarily by the thread that opened them
+        connection = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode, NORMAL only gives up durability of the last
+        # transactions on power loss, never consistency
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Returns an idle connection, opening a new one if there are none.
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, connection: sqlite3.Connection):
+        """
+        Returns a connection to the pool. Any transaction left open is rolled
+        back first.
+        """
+        if connection.in_transaction:
+            connection.rollback()
+        if self.idle.qsize() < self.max_idle:
+            self.idle.put(connection)
+        else:
+            self.data_versions.pop(connection, None)
+            connection.close()
+
+    def bump_version(self):
+        """
+        Records that a write was committed, invalidating every cached result.
+        """
+        with self._version_lock:
+            self.version += 1
+            self.cache.clear()
+
+    def check_version(self, connection: sqlite3.Connection):
+        """
+        Invalidates every cached result if the database was written to
+        through any other connection (e.g. by another process) since the
+        given connection last checked, going by its data_version. Writes
+        through the connection itself do not change it, so they still have
+        to call bump_version.
+        """
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        # a connection checking for the first time cannot tell what it missed
+        if self.data_versions.get(connection) != data_version:
+            self.data_versions[connection] = data_version
+            self.bump_version()
+
+    def cached(self, key: Hashable, compute: Callable[[], Any],
+               connection: Optional[sqlite3.Connection]=None) -> Any:
+        """
+        Returns the cached result for the given key, calling compute (and
+        caching its result) if there is none for the current version. If a
+        connection is given, it is first used to check that the database
+        was not written to elsewhere (see check_version). Cached results are
+        shared, so they must not be modified.
+        """
+        if connection is not None:
+            self.check_version(connection)
+        # read before computing, so that a write committed mid-computation
+        # leaves the result marked as stale
+        version = self.version
+        hit = self.cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        result = compute()
+        if version == self.version:
+            self.cache[key] = (version, result)
+        return result
+
+    def close(self):
+        """
+        Closes every idle connection.
+        """
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+                self.data_versions.pop(connection, None)
+                connection.close()
+            except queue.Empty:
+                return
+
+def get_pool(db_path: str, setup: Optional[Callable[[sqlite3.Connection], None]]=None) -> ConnectionPool:
+    """
+    Returns the process-wide connection pool for the database at the given
+    path, creating it (and running setup) on first use.
+    """
+    key = os.path.abspath(db_path)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(db_path, setup)
+        return _POOLS[key]
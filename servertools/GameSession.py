@@ -0,0 +1,232 @@
+from typing import Dict, List, Optional, Tuple
+
+from servertools.Corpus import Corpus
+from servertools.Lyrics import Lyrics, Round
+from servertools.Metrics import ROUNDS_SERVED, GUESSES_CORRECT, GUESSES_INCORRECT, HINTS, GIVE_UPS
+
+# the points a correct answer earns, per game difficulty
+POINTS_MAPPING = {"Easy (an entire section, e.g. chorus)": 1,
+                  "Medium (2 lines)": 3,
+                  "Hard (1 line)": 5}
+LIVES = 5
+# the number of hints available in a Survival game (one more is earned every 10 rounds)
+HINTS_LIMIT = 20
+# the hints available per round: the album, the next line and the previous line
+HINTS_PER_ROUND = 3
+
+class GameSession():
+    """
+    Class that runs one game: it generates the rounds, checks guesses, and
+    keeps the score (points, lives, hints, streaks and per-album results).
+    It holds no UI state, so any frontend (or a bot) can drive it by calling
+    guess, hint, give_up, new_round and end. Calls that are not valid in the
+    current state (e.g. guessing once the round is over, or starting a round
+    once the game is over) raise a RuntimeError.
+
+    In Survival mode, a game ends once the player runs out of lives, and
+    hints are limited; in Casual mode, lives and hints are unlimited.
+
+    Args:
+        corpus:
+            The Corpus to generate lyrics from
+
+        difficulty:
+            The game difficulty, i.e. one of the keys of POINTS_MAPPING
+
+        survival:
+            Whether the game is in Survival (rather than Casual) mode
+
+        albums:
+            Optional parameter specifying the albums to generate lyrics from;
+            all albums are used if not given
+
+        seed:
+            Optional parameter specifying the seed used to draw prompts
+
+        acceptable_answers, remove_parentheses, keep_parentheses:
+            How guesses are checked; see Lyrics.get_guess_feedback
+    """
+    __slots__ = ("lyrics", "difficulty", "survival", "albums", "acceptable_answers",
+                 "remove_parentheses", "keep_parentheses", "current", "round_count",
+                 "points", "lives", "hints", "hints_used", "hints_limit", "streak",
+                 "streaks", "round_results", "album_results", "round_over", "finished",
+                 "rounds_served")
+
+    def __init__(self, corpus: Corpus, difficulty: str, survival: bool=True,
+                 albums: Optional[List[str]]=None, seed: Optional[int]=None,
+                 acceptable_answers: Optional[dict]=None, remove_parentheses: bool=False,
+                 keep_parentheses: Optional[List]=None):
+        """Constructor"""
+
+        if difficulty not in POINTS_MAPPING:
+            raise ValueError(f"Unknown difficulty: {difficulty}")
+        self.lyrics = Lyrics(data=corpus, albums=albums, seed=seed)
+        self.difficulty = difficulty
+        self.survival = survival
+        self.albums = albums
+        self.acceptable_answers = acceptable_answers
+        self.remove_parentheses = remove_parentheses
+        self.keep_parentheses = keep_parentheses
+        self.points = 0
+        self.lives = LIVES
+        self.hints_used = 0
+        self.hints_limit = HINTS_LIMIT
+        self.streak = 0
+        self.streaks = []
+        self.round_results = []
+        # the results of each round, per album
+        self.album_results = {album: [] for album in (albums if albums is not None else corpus.album_names)}
+        self.finished = False
+        self.round_count = 0
+        # no round is in progress until the first one starts
+        self.round_over = True
+        # looked up once, since it is incremented every round
+        self.rounds_served = ROUNDS_SERVED.labels(difficulty.split()[0])
+        self.new_round()
+
+    def new_round(self) -> Round:
+        """
+        Method that starts the next round, once the current one is over.
+
+        Returns:
+            The new round.
+        """
+        if self.finished:
+            raise RuntimeError("The game is over")
+        if not self.round_over:
+            raise RuntimeError("The current round is not over")
+        self.round_count += 1
+        self.hints = 0
+        self.round_over = False
+        self.current = self.lyrics.next_round(self.difficulty)
+        self.rounds_served.inc()
+        return self.current
+
+    def _record(self, correct: bool):
+        """
+        Records the current round's result.
+        """
+        self.round_results.append(correct)
+        self.album_results[self.current.album_name].append(correct)
+
+    def _lose_life(self):
+        """
+        Costs a life and breaks the streak; ends the game in Survival mode if
+        it was the last life.
+        """
+        self.lives -= 1
+        self.streaks.append(self.streak)
+        self.streak = 0
+        if self.survival and self.lives == 0:
+            self.end()
+
+    def guess(self, guess: str) -> bool:
+        """
+        Method that checks a guess of the current round's track name. A
+        correct guess earns points and ends the round (and, in Survival mode,
+        earns one more hint every 10 rounds); an incorrect one costs a point
+        and a life.
+
+        Args:
+            guess:
+                The player's guess as a string
+
+        Returns:
+            A boolean; True if the guess is correct, False otherwise.
+        """
+        if self.round_over or self.finished:
+            raise RuntimeError("No round is in progress")
+        correct = self.lyrics.get_guess_feedback(guess,
+                                                 acceptable_answers=self.acceptable_answers,
+                                                 remove_parentheses=self.remove_parentheses,
+                                                 keep_parentheses=self.keep_parentheses)
+        if correct:
+            GUESSES_CORRECT.inc()
+            self.points += POINTS_MAPPING[self.difficulty]
+            if self.survival and (self.round_count + 1) % 10 == 0:
+                self.hints_limit += 1
+            self.streak += 1
+            self.round_over = True
+            self._record(True)
+        else:
+            GUESSES_INCORRECT.inc()
+            self.points -= 1
+            self._lose_life()
+        return correct
+
+    def can_hint(self) -> bool:
+        """
+        Returns whether a hint is currently available.
+        """
+        return (not self.round_over and not self.finished and self.hints < HINTS_PER_ROUND and
+                (not self.survival or self.hints_used < self.hints_limit))
+
+    def hint(self) -> Tuple[int, str]:
+        """
+        Method that reveals the next hint for the current round, at the cost
+        of a point.
+
+        Returns:
+            A tuple (n, hint), where n is the hint's number within the round:
+            1 for the album, 2 for the next line and 3 for the previous line.
+        """
+        if not self.can_hint():
+            raise RuntimeError("No hint is available")
+        HINTS.inc()
+        self.hints += 1
+        self.hints_used += 1
+        self.points -= 1
+        hints = [self.current.album_name, self.current.next_line, self.current.previous_line]
+        return self.hints, hints[self.hints - 1]
+
+    def give_up(self):
+        """
+        Method that ends the current round unanswered, at the cost of 2
+        points and a life.
+        """
+        if self.round_over or self.finished:
+            raise RuntimeError("No round is in progress")
+        GIVE_UPS.inc()
+        self.points -= 2
+        self.round_over = True
+        self._record(False)
+        self._lose_life()
+
+    def end(self):
+        """
+        Method that ends the game; a round left unanswered counts as incorrect.
+        """
+        if len(self.round_results) != self.round_count:
+            self._record(False)
+        self.finished = True
+
+    @property
+    def hints_remaining(self) -> int:
+        """
+        The number of hints left in a Survival game.
+        """
+        return self.hints_limit - self.hints_used
+
+    @property
+    def possible_points(self) -> int:
+        """
+        The points that answering every round correctly would have earned.
+        """
+        return self.round_count * POINTS_MAPPING[self.difficulty]
+
+    @property
+    def max_streak(self) -> int:
+        """
+        The longest run of consecutive correct answers (that has ended).
+        """
+        return max(self.streaks) if len(self.streaks) else 0
+
+    def album_accuracies(self) -> Dict[str, Tuple[float, int, int]]:
+        """
+        Returns each album's accuracy, formatted as a dict where the album is
+        the key and the value is a tuple (percent correct, rounds correct,
+        rounds), ordered from the best to the worst accuracy.
+        """
+        accs = {album: (round(sum(results) * 100 / len(results), 2), sum(results), len(results))
+                if len(results) else (0.0, 0, 0) for album, results in self.album_results.items()}
+        return dict(sorted(accs.items(), key=lambda x: (x[1][0], x[1][2], x[1][1]), reverse=True))
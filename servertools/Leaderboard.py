@@ -1,9 +1,53 @@
-import pandas as pd
+import os
+import atexit
+import queue
+import zlib
 import sqlite3
+import tempfile
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from concurrent.futures import Future
+
+from servertools.Database import get_pool
+from servertools.ScoreDistribution import ScoreDistribution
+from servertools.Metrics import LEADERBOARD_QUERY_SECONDS, LEADERBOARD_COMMIT_SECONDS, LEADERBOARD_SUBMISSIONS
+from servertools.Timing import timed
+
+# the time zone datetimes are displayed in (and the legacy tables stored)
+DISPLAY_TIMEZONE = "US/Eastern"
+LEGACY_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# the time windows leaderboards can be restricted to (see window_start)
+WINDOWS = ["All time", "Today", "This week", "This month"]
+
+# per database, each difficulty's ScoreDistribution; built from the database
+# on first use, then updated as results are added. Also per database, the
+# change count (see create_tables) the distributions are up to date with
+_DISTRIBUTIONS = {}
+_DISTRIBUTION_VERSIONS = {}
+_DISTRIBUTIONS_LOCK = threading.Lock()
+
+_WRITERS = {}
+_WRITERS_LOCK = threading.Lock()
 
 class Leaderboards:
     """
-    A class that manages leaderboards via a SQLite database. 
+    A class that manages leaderboards via a SQLite database. Connections are
+    borrowed from a process-wide pool (see Database.ConnectionPool), and the 
+    leaderboards are created the first time a database is used.
+
+    The results for every difficulty are stored in a single table, with 
+    their submission time as a Unix timestamp. Each leaderboard can be 
+    restricted to the results submitted since a given time (e.g. today's;
+    see window_start), in which case only those results are read. Databases in the previous 
+    layout (one table per difficulty, with EST datetime strings) are 
+    migrated the first time they are used; see migrate_legacy_tables.
+
+    Reads are cached by the pool until the next result is added (by this 
+    process or any other; see ConnectionPool.check_version), so repeated 
+    reads between submissions do not query the database. The dataframes 
+    returned are shared between callers and must not be modified.
 
     Args: 
         db_path: The path to the database.
@@ -16,45 +60,106 @@ class Leaderboards:
         """
 
         self.db_path = db_path
-        self.table_names = [f"leaderboard_{diff}" for diff in ["easy", "medium", "hard"]]
         self.difficulty_mapping = {"Easy (an entire section, e.g. chorus)": "easy", 
                                    "Medium (2 lines)": "medium", 
                                    "Hard (1 line)": "hard"}
 
     def __enter__(self):
         """
-        Connects the database and creates the leaderboards for each
-        difficulty if they do not already exist.
+        Borrows a connection to the database from the pool, creating the 
+        pool (and the leaderboards) if this is the first use.
         """
 
-        self.connection = sqlite3.connect(self.db_path)
+        self.pool = get_pool(self.db_path, setup=self.create_tables)
+        self.connection = self.pool.acquire()
         self.cursor = self.connection.cursor()
-        self.create_tables()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Automatically closes the database connection.
+        Automatically returns the database connection to the pool.
         """
 
-        self.connection.close()
+        self.cursor.close()
+        self.pool.release(self.connection)
 
-    def create_tables(self):
+    def create_tables(self, connection):
         """
-        Method that creates the three leaderboards (one for each difficulty) if
-        they do not already exist.
+        Method that creates the leaderboard table if it does not already 
+        exist, along with the indexes used to rank it and the change count,
+        and migrates any legacy tables into it, in a single transaction.
+
+        Args: 
+            connection: A connection to the database.
         """
         
-        for table_name in self.table_names:
-            create_query = f"""CREATE TABLE IF NOT EXISTS {table_name} (
+        with connection: 
+            connection.execute("BEGIN")
+            create_query = """CREATE TABLE IF NOT EXISTS leaderboard (
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                difficulty TEXT NOT NULL,
                                 name TEXT NOT NULL,
                                 points INTEGER NOT NULL,
                                 rounds INTEGER NOT NULL,
-                                datetime TEXT NOT NULL)"""
-            self.cursor.execute(create_query)
-            self.connection.commit()
+                                timestamp INTEGER NOT NULL)"""
+            connection.execute(create_query)
+            # each difficulty's rows are stored in rank order in this index, so
+            # a page of a leaderboard is a range scan, and ranks are counted 
+            # from the index alone
+            index_query = """CREATE INDEX IF NOT EXISTS leaderboard_ranking 
+                             ON leaderboard (difficulty, points DESC, rounds DESC, timestamp)"""
+            connection.execute(index_query)
+            # time-windowed leaderboards range-scan this index instead, so 
+            # their cost depends on the size of the window, not the history
+            recent_query = """CREATE INDEX IF NOT EXISTS leaderboard_recent 
+                              ON leaderboard (difficulty, timestamp, points, rounds)"""
+            connection.execute(recent_query)
+            # counts every change to the leaderboard, whoever makes it (e.g.
+            # another process, or a manual cleanup), so that in-memory state
+            # derived from the table can tell when it is out of date
+            connection.execute("""CREATE TABLE IF NOT EXISTS leaderboard_changes (
+                                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                                    version INTEGER NOT NULL)""")
+            connection.execute("INSERT OR IGNORE INTO leaderboard_changes (id, version) VALUES (0, 0)")
+            for event in ["INSERT", "UPDATE", "DELETE"]: 
+                connection.execute(f"""CREATE TRIGGER IF NOT EXISTS leaderboard_{event.lower()}_counted 
+                                       AFTER {event} ON leaderboard 
+                                       BEGIN UPDATE leaderboard_changes SET version = version + 1; END""")
+            migrate_legacy_tables(connection)
+
+    def iter_export(self, compress=False, chunk_size=1 << 20):
+        """
+        Method that yields a snapshot of the database, as a standalone 
+        SQLite file, in chunks. The snapshot is taken with SQLite's online 
+        backup API into a temporary file; in WAL mode, this does not block 
+        anyone adding results meanwhile.
+
+        Args: 
+            compress: Whether to gzip the snapshot.
+
+            chunk_size: The number of bytes read from the snapshot at a time.
+
+        Returns: 
+            A generator of bytes.
+        """
+
+        with tempfile.TemporaryDirectory() as directory: 
+            snapshot_path = os.path.join(directory, "leaderboard.db")
+            snapshot = sqlite3.connect(snapshot_path)
+            try: 
+                self.connection.backup(snapshot)
+            finally: 
+                snapshot.close()
+
+            # wbits=31 writes a gzip header and trailer
+            compressor = zlib.compressobj(wbits=31) if compress else None
+            with open(snapshot_path, "rb") as f: 
+                while chunk := f.read(chunk_size): 
+                    yield compressor.compress(chunk) if compressor else chunk
+            if compressor: 
+                yield compressor.flush()
     
+    @timed
     def add_to_leaderboard(self, difficulty, results):
         """
         Method that adds a user's results to the corresponding leaderboard.
@@ -63,40 +168,508 @@ class Leaderboards:
             difficulty: A string specifying the game difficulty; this 
                         determines which leaderboard the results are added to.
 
-            results: A tuple (name, points, rounds, points, datetime) containing the user's 
-            game results.
+            results: A tuple (name, points, rounds, timestamp) containing the 
+            user's game results, where timestamp is the submission time in 
+            seconds since the Unix epoch.
+
+        Returns: 
+            A tuple (row_id, rank), where row_id identifies the added results
+            and rank is their position on the leaderboard.
         """
         
+        return self.add_many_to_leaderboards([(difficulty, results)])[0]
+
+    @timed
+    def add_many_to_leaderboards(self, entries):
+        """
+        Method that adds several users' results in a single transaction 
+        (i.e., with a single commit).
+
+        Args: 
+            entries: A list of (difficulty, results) tuples, formatted as 
+                     the arguments of add_to_leaderboard.
+
+        Returns: 
+            A list containing the (row_id, rank) of each entry, where each 
+            rank is as of that entry's insertion.
+        """
+
+        added = []
+        add_query = """INSERT INTO leaderboard (difficulty, name, points, rounds, timestamp)
+                       VALUES (?, ?, ?, ?, ?)"""
+        # the write lock is taken up front, so that no one else can commit 
+        # between checking that the distributions are up to date and 
+        # committing these results
+        self.connection.execute("BEGIN IMMEDIATE")
+        # checked (and, if need be, rebuilt) before inserting, since a 
+        # distribution built within this transaction would count these 
+        # results before they are committed
+        distributions = self._distributions()
+        # the points of the entries added so far in this (uncommitted) 
+        # transaction, which the distributions do not include yet
+        uncommitted = {db_difficulty: [] for db_difficulty in self.difficulty_mapping.values()}
+        for difficulty, results in entries: 
+            db_difficulty = self.difficulty_mapping[difficulty]
+            name, points, rounds, timestamp = results
+            self.cursor.execute(add_query, (db_difficulty, name, points, rounds, int(timestamp)))
+            row_id = self.cursor.lastrowid
+            uncommitted_above = sum(other > points for other in uncommitted[db_difficulty])
+            rank = self._count_better(db_difficulty, points, rounds, int(timestamp), row_id, 
+                                      distribution=distributions[db_difficulty], 
+                                      uncommitted_above=uncommitted_above) + 1
+            added.append((row_id, rank))
+            uncommitted[db_difficulty].append(points)
+        # held through the commit, so that a distribution being built 
+        # meanwhile cannot count these results twice
+        key = os.path.abspath(self.db_path)
+        with _DISTRIBUTIONS_LOCK: 
+            # includes this transaction's changes
+            version = self._change_count()
+            with LEADERBOARD_COMMIT_SECONDS.time(): 
+                self.connection.commit()
+            if _DISTRIBUTIONS.get(key) is distributions: 
+                for difficulty, (_, points, _, _) in entries: 
+                    distributions[self.difficulty_mapping[difficulty]].add(points)
+                _DISTRIBUTION_VERSIONS[key] = version
+        LEADERBOARD_SUBMISSIONS.inc(len(entries))
+        self.pool.bump_version()
+        return added
+
+    def _change_count(self):
+        """
+        Method that returns the number of changes ever made to the 
+        leaderboard (see create_tables).
+        """
+
+        self.cursor.execute("SELECT version FROM leaderboard_changes")
+        return self.cursor.fetchone()[0]
+
+    def _distributions(self):
+        """
+        Method that returns the database's score distributions (one per 
+        difficulty). They are built from the database on first use, and 
+        rebuilt whenever the change count shows that the leaderboard was 
+        changed other than by this process (e.g. by another worker), so 
+        checking them costs a single-row read.
+        """
+
+        key = os.path.abspath(self.db_path)
+        with _DISTRIBUTIONS_LOCK: 
+            # read under the lock, so that a commit by this process cannot 
+            # fall between reading the count and updating the distributions
+            if key in _DISTRIBUTIONS and _DISTRIBUTION_VERSIONS[key] == self._change_count(): 
+                return _DISTRIBUTIONS[key]
+            # the count and the points are read from a single snapshot
+            started = not self.connection.in_transaction
+            if started: 
+                self.connection.execute("BEGIN")
+            try: 
+                version = self._change_count()
+                with LEADERBOARD_QUERY_SECONDS.labels("distributions").time(): 
+                    self.cursor.execute("""SELECT difficulty, points, COUNT(*) FROM leaderboard 
+                                           GROUP BY difficulty, points""")
+                    counts = self.cursor.fetchall()
+            finally: 
+                if started: 
+                    self.connection.commit()
+            distributions = {db_difficulty: ScoreDistribution() 
+                             for db_difficulty in self.difficulty_mapping.values()}
+            for db_difficulty, points, count in counts: 
+                distributions[db_difficulty].add(points, count)
+            _DISTRIBUTIONS[key] = distributions
+            _DISTRIBUTION_VERSIONS[key] = version
+            return distributions
+
+    @timed
+    def get_score_stats(self, difficulty, points):
+        """
+        Method that returns where a score stands on a leaderboard: its rank
+        by points alone, how many results scored strictly more, the number 
+        of results, and the percentage of results that scored strictly less.
+        Answered from an in-memory score distribution, without querying the
+        database.
+
+        Args: 
+            difficulty: A string specifying the game difficulty.
+
+            points: The score.
+
+        Returns: 
+            A ScoreStats tuple.
+        """
+
+        distribution = self._distributions()[self.difficulty_mapping[difficulty]]
+        with _DISTRIBUTIONS_LOCK: 
+            return distribution.stats(points)
+
+    def _count_better(self, db_difficulty, points, rounds, timestamp, row_id, since=None, 
+                      distribution=None, uncommitted_above=0):
+        """
+        Method that returns the number of results ranked strictly above the
+        given one (among those submitted since the given time, if any). 
+
+        On the all-time leaderboard, the results with more points are 
+        counted off the score distribution, in O(log range); only the 
+        results tied on points are counted in SQL, from a range of the 
+        ranking index. The distribution only holds committed results, so 
+        uncommitted_above gives the number of results with more points added
+        earlier in the current transaction (whose caller passes the 
+        distribution it checked before inserting). Windowed ranks count 
+        every term from ranges of the window within the recent index.
+        """
+
+        if since is None: 
+            table, window = "leaderboard", ""
+            if distribution is None: 
+                distribution = self._distributions()[db_difficulty]
+            with _DISTRIBUTIONS_LOCK: 
+                above = distribution.count_above(points) + uncommitted_above
+            above_query = ""
+        else: 
+            table, window = "leaderboard INDEXED BY leaderboard_recent", "AND timestamp >= :since"
+            above = 0
+            above_query = f"""(SELECT COUNT(*) FROM {table} 
+                               WHERE difficulty = :difficulty AND points > :points {window}) + """
+        count_query = f"""SELECT {above_query}(SELECT COUNT(*) FROM {table} 
+                                  WHERE difficulty = :difficulty AND points = :points AND rounds > :rounds {window})
+                               + (SELECT COUNT(*) FROM {table} 
+                                  WHERE difficulty = :difficulty AND points = :points AND rounds = :rounds 
+                                  AND timestamp < :timestamp {window})
+                               + (SELECT COUNT(*) FROM {table} 
+                                  WHERE difficulty = :difficulty AND points = :points AND rounds = :rounds 
+                                  AND timestamp = :timestamp AND id < :id {window})"""
+        self.cursor.execute(count_query, {"difficulty": db_difficulty, "points": points, "rounds": rounds, 
+                                          "timestamp": timestamp, "id": row_id, "since": since})
+        return above + self.cursor.fetchone()[0]
+
+    @timed
+    def get_rank(self, difficulty, row_id, since=None):
+        """
+        Method that returns the current rank of previously added results.
+
+        Args: 
+            difficulty: A string specifying the game difficulty.
+
+            row_id: The row id returned by add_to_leaderboard.
+
+            since: Optional Unix timestamp; if given, the rank is among the 
+                   results submitted since then.
+
+        Returns: 
+            The results' rank, or None if they are not on the leaderboard.
+        """
+
+        return self.pool.cached(("rank", difficulty, row_id, since), 
+                                lambda: self._get_rank(difficulty, row_id, since), self.connection)
+
+    def _get_rank(self, difficulty, row_id, since):
+        db_difficulty = self.difficulty_mapping[difficulty]
+        with LEADERBOARD_QUERY_SECONDS.labels("rank").time(): 
+            self.cursor.execute("SELECT points, rounds, timestamp FROM leaderboard WHERE id = ? AND difficulty = ?", 
+                                (row_id, db_difficulty))
+            row = self.cursor.fetchone()
+            if row is None or (since is not None and row[2] < since): 
+                return None
+            return self._count_better(db_difficulty, *row, row_id, since) + 1
+
+    @timed
+    def count_entries(self, difficulty, since=None):
+        """
+        Method that returns the number of results on a leaderboard. The 
+        all-time count is read off the in-memory score distribution (see 
+        get_score_stats); only windowed counts query the database.
+
+        Args: 
+            difficulty: A string specifying the game difficulty.
+
+            since: Optional Unix timestamp; if given, only results submitted
+                   since then are counted.
+        """
+
+        return self.pool.cached(("count", difficulty, since), lambda: self._count_entries(difficulty, since), 
+                                self.connection)
+
+    def _count_entries(self, difficulty, since):
+        db_difficulty = self.difficulty_mapping[difficulty]
+        if since is None:
+            # the score distribution keeps the all-time total (and is rebuilt
+            # if anyone else has changed the leaderboard since it was built)
+            return self._distributions()[db_difficulty].total
+        with LEADERBOARD_QUERY_SECONDS.labels("count").time(): 
+            self.cursor.execute("SELECT COUNT(*) FROM leaderboard WHERE difficulty = ? AND timestamp >= ?", 
+                                (db_difficulty, since))
+            return self.cursor.fetchone()[0]
+
+    @timed
+    def get_leaderboard(self, difficulty, limit=None, offset=0, since=None):
+        """
+        Method that returns (a page of) one leaderboard, ranked by the number
+        of points the users have earned. Ties are broken by the number of 
+        rounds played, then by who submitted first. Ranking is done by 
+        SQLite, so only the requested rows are read.
+
+        Args: 
+            difficulty: A string specifying the game difficulty.
+
+            limit: The maximum number of results to return; all results are
+                   returned if None.
+
+            offset: The number of top-ranked results to skip, e.g. 50 to 
+                    start from rank 51.
+
+            since: Optional Unix timestamp; if given, only results submitted
+                   since then are ranked (see window_start).
+
+        Returns: 
+            The leaderboard as a pandas dataframe indexed by rank.
+        """
+
+        return self.pool.cached(("page", difficulty, limit, offset, since), 
+                                lambda: self._get_leaderboard(difficulty, limit, offset, since), 
+                                self.connection)
+
+    def _get_leaderboard(self, difficulty, limit, offset, since):
         db_difficulty = self.difficulty_mapping[difficulty]
-        add_query = f"""INSERT INTO leaderboard_{db_difficulty} (name, points, rounds, datetime)
-                        VALUES (?, ?, ?, ?)"""
-        self.cursor.execute(add_query, results)
-        self.connection.commit()
+        # the all-time page is read off the ranking index; a window's results
+        # are range-scanned off the recent index and sorted. Ranks within the 
+        # page are then numbered from the offset
+        if since is None: 
+            table, window = "leaderboard", ""
+        else: 
+            table, window = "leaderboard INDEXED BY leaderboard_recent", "AND timestamp >= :since"
+        rank_query = f"""SELECT :offset + ROW_NUMBER() OVER (ORDER BY points DESC, rounds DESC, timestamp, id), 
+                                name, points, rounds, timestamp
+                         FROM (SELECT id, name, points, rounds, timestamp 
+                               FROM {table}
+                               WHERE difficulty = :difficulty {window}
+                               ORDER BY points DESC, rounds DESC, timestamp, id
+                               LIMIT :limit OFFSET :offset)
+                         ORDER BY 1"""
+        with LEADERBOARD_QUERY_SECONDS.labels("page").time(): 
+            self.cursor.execute(rank_query, {"difficulty": db_difficulty, "since": since, "offset": offset,
+                                             "limit": -1 if limit is None else limit})
+            rows = self.cursor.fetchall()
 
-    def get_leaderboards(self):
+        columns = ["Rank", "Name", "Points", "Rounds", "Datetime (EST)"]
+        # only the page's timestamps are formatted
+        formatted = format_timestamps([row[-1] for row in rows])
+        return pd.DataFrame([row[:-1] + (formatted_datetime,) for row, formatted_datetime in zip(rows, formatted)], 
+                            columns=columns).set_index("Rank")
+
+    @timed
+    def get_leaderboards(self, limit=None, offset=0, since=None):
         """
         Method that returns the most updated leaderboards, each ranked by the
         number of points the users have earned.
 
+        Args: 
+            limit: The maximum number of results to return per leaderboard;
+                   all results are returned if None.
+
+            offset: The number of top-ranked results to skip per leaderboard.
+
+            since: Optional Unix timestamp; if given, only results submitted
+                   since then are ranked.
+
         Returns: 
             A dictionary containing the leaderboards (as pandas dataframes) 
             for each difficulty.
         """
 
-        all_leaderboards = {}
-        columns = ["ID", "Name", "Points", "Rounds", "Datetime (EST)"]
-        final_cols = ["Rank", "Name", "Points", "Rounds", "Datetime (EST)"]
+        return {difficulty: self.get_leaderboard(difficulty, limit, offset, since) 
+                for difficulty in self.difficulty_mapping}
 
-        for table_name, long_name in zip(self.table_names, list(self.difficulty_mapping.keys())): 
-            self.cursor.execute(f"SELECT * FROM {table_name}")
-            rows = self.cursor.fetchall()
+def window_start(window, now=None):
+    """
+    Returns the start of a time window, in DISPLAY_TIMEZONE: midnight today,
+    midnight on Monday, or midnight on the 1st of the month.
 
-            df = pd.DataFrame(rows, columns=columns)
-            df["Datetime (EST)"] = pd.to_datetime(df["Datetime (EST)"])
-            # the primary determinator of rank is the number of points earned
-            df = df.sort_values(by=["Points", "Rounds", "Datetime (EST)"], ascending=[False, False, True])
-            df["Rank"] = df[["Points"]].rank(method="first", ascending=False).astype(int)
-            final_df = df[final_cols].set_index("Rank")
-            all_leaderboards[long_name] = final_df
-        
-        return all_leaderboards
\ No newline at end of file
+    Args: 
+        window: One of WINDOWS.
+
+        now: Optional Unix timestamp to use as the current time.
+
+    Returns: 
+        The window's start as a Unix timestamp, or None for "All time".
+    """
+
+    if window == "All time": 
+        return None
+    timezone = ZoneInfo(DISPLAY_TIMEZONE)
+    now = datetime.now(timezone) if now is None else datetime.fromtimestamp(now, timezone)
+    start = now.date()
+    if window == "This week": 
+        start -= timedelta(days=start.weekday())
+    elif window == "This month": 
+        start = start.replace(day=1)
+    elif window != "Today": 
+        raise ValueError(f"Unknown window: {window}")
+    return int(datetime(start.year, start.month, start.day, tzinfo=timezone).timestamp())
+
+def format_timestamps(timestamps):
+    """
+    Formats Unix timestamps as "%Y-%m-%d %H:%M:%S" strings in DISPLAY_TIMEZONE.
+
+    Args: 
+        timestamps: A list of Unix timestamps (in seconds).
+
+    Returns: 
+        A list of datetime strings.
+    """
+
+    # pages are small, so this is faster in plain Python than in pandas
+    timezone = ZoneInfo(DISPLAY_TIMEZONE)
+    return [datetime.fromtimestamp(timestamp, timezone).strftime(LEGACY_DATETIME_FORMAT) 
+            for timestamp in timestamps]
+
+def migrate_legacy_tables(connection):
+    """
+    Moves the results in the legacy per-difficulty tables (leaderboard_easy,
+    leaderboard_medium and leaderboard_hard, whose datetimes are EST 
+    strings) into the leaderboard table, then drops the legacy tables. Does
+    nothing if there are no legacy tables. Results keep their order (and 
+    therefore their ranks), but are given new row ids.
+
+    Args: 
+        connection: A connection to the database; the caller commits.
+
+    Returns: 
+        The number of results migrated.
+    """
+
+    eastern = ZoneInfo(DISPLAY_TIMEZONE)
+    migrated = 0
+    for db_difficulty in ["easy", "medium", "hard"]: 
+        table_name = f"leaderboard_{db_difficulty}"
+        exists = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", 
+                                    (table_name,)).fetchone()
+        if not exists: 
+            continue
+        rows = connection.execute(f"SELECT name, points, rounds, datetime FROM {table_name} ORDER BY id").fetchall()
+        connection.executemany("""INSERT INTO leaderboard (difficulty, name, points, rounds, timestamp)
+                                  VALUES (?, ?, ?, ?, ?)""", 
+                               [(db_difficulty, name, points, rounds, 
+                                 int(datetime.strptime(legacy_datetime, LEGACY_DATETIME_FORMAT)
+                                     .replace(tzinfo=eastern).timestamp()))
+                                for name, points, rounds, legacy_datetime in rows])
+        connection.execute(f"DROP TABLE {table_name}")
+        migrated += len(rows)
+    return migrated
+
+class LeaderboardWriter():
+    """
+    A class that adds results to the leaderboards from a background thread,
+    so that submitting does not wait on the disk. Submissions that arrive 
+    while a commit is in progress are added together, in one transaction. 
+    Pending submissions are written before the process exits.
+
+    Args: 
+        db_path: The path to the database.
+
+        max_batch: The maximum number of submissions added per transaction.
+    """
+
+    def __init__(self, db_path="leaderboard.db", max_batch=256):
+
+        """
+        Constructor
+        """
+
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.difficulty_mapping = Leaderboards(db_path).difficulty_mapping
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="LeaderboardWriter", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, difficulty, results):
+        """
+        Method that queues a user's results to be added to the corresponding 
+        leaderboard.
+
+        Args: 
+            difficulty: A string specifying the game difficulty.
+
+            results: A tuple (name, points, rounds, timestamp) containing the 
+            user's game results, where timestamp is the submission time in 
+            seconds since the Unix epoch.
+
+        Returns: 
+            A Future that resolves to the (row_id, rank) that 
+            Leaderboards.add_to_leaderboard would have returned.
+        """
+
+        # checked here, since one bad submission would fail its whole batch
+        if difficulty not in self.difficulty_mapping: 
+            raise KeyError(difficulty)
+        future = Future()
+        self.pending.put((difficulty, results, future))
+        return future
+
+    def _run(self):
+        """
+        The writer thread: waits for a submission, then adds it along with 
+        every other pending submission.
+        """
+
+        while True: 
+            batch = [self.pending.get()]
+            while len(batch) < self.max_batch: 
+                try: 
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty: 
+                    break
+            # None is queued by close
+            stop = None in batch
+            batch = [submission for submission in batch if submission is not None]
+            if batch: 
+                self._write(batch)
+            if stop: 
+                return
+
+    def _write(self, batch):
+        try: 
+            with Leaderboards(self.db_path) as leaderboard: 
+                added = leaderboard.add_many_to_leaderboards([(difficulty, results) 
+                                                              for difficulty, results, _ in batch])
+        except Exception as e: 
+            for _, _, future in batch: 
+                future.set_exception(e)
+            return
+        for (_, _, future), row_rank in zip(batch, added): 
+            future.set_result(row_rank)
+
+    def close(self):
+        """
+        Method that writes all pending submissions and stops the writer thread.
+        """
+
+        if self.thread.is_alive(): 
+            self.pending.put(None)
+            self.thread.join()
+
+def get_writer(db_path="leaderboard.db"):
+    """
+    Returns the process-wide LeaderboardWriter for the database at the given
+    path, starting it on first use.
+    """
+
+    key = os.path.abspath(db_path)
+    with _WRITERS_LOCK: 
+        if key not in _WRITERS: 
+            _WRITERS[key] = LeaderboardWriter(db_path)
+        return _WRITERS[key]
+
+if __name__ == "__main__": 
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrates a leaderboard database from the "
+                                                 "per-difficulty tables to the single leaderboard table.")
+    parser.add_argument("db_path", nargs="?", default="leaderboard.db", help="the database to migrate")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db_path)
+    Leaderboards(args.db_path).create_tables(connection)
+    print(f"{args.db_path}: {connection.execute('SELECT COUNT(*) FROM leaderboard').fetchone()[0]} results")
+    connection.close()
@@ -1,79 +1,188 @@
 import random
-import math
-import re
-import stringdist
+import numpy as np
 import pandas as pd
-from typing import Optional, List
+from collections import deque
+from typing import Dict, Optional, List, NamedTuple, Union
+
+from servertools.Corpus import Corpus, AlbumView, Eligibility
+from servertools.Sampler import PermutationSampler
+from servertools.TitleMatcher import load_shared_matcher
+from servertools.Timing import timed
+
+# the kind of prompt (see Corpus.prompt_rows) each game difficulty generates
+MODE_PROMPTS = {"Easy (an entire section, e.g. chorus)": "sections", 
+                "Medium (2 lines)": "line_pairs", 
+                "Hard (1 line)": "lines"}
+# only lyrics of at least 3 words are generated in Hard mode
+DEFAULT_ELIGIBILITY = {"Hard (1 line)": Eligibility(min_words=3)}
+
+class Round(NamedTuple): 
+    """
+    A fully resolved round: the generated lyrics along with everything the 
+    game reveals about them (answer, hints and feedback).
+    """
+    lyrics: str
+    track_name: str
+    album_name: str
+    section: str
+    previous_line: str
+    next_line: str
+    row: int
+    start_line: int
+    end_line: int
 
 class Lyrics(): 
     """
-    Class to manage lyric generation.
+    Class to manage lyric generation. A Lyrics instance only holds the state
+    of the current round (and a small buffer of prefetched rounds); the 
+    lyrics themselves live in a (shareable) Corpus.
+
+    Prompts are drawn without replacement, so no prompt repeats until every
+    prompt for the game's difficulty and albums has been shown.
 
     Args:
         data: 
-            A pandas dataframe containing artist lyrics
+            A Corpus, or a pandas dataframe containing artist lyrics (which 
+            is converted into a Corpus)
+
+        albums: 
+            Optional parameter specifying the albums to generate lyrics from;
+            all albums are used if not given
+
+        prefetch: 
+            The number of rounds generated at a time by next_round
+
+        seed: 
+            Optional parameter specifying the seed used to draw prompts; a 
+            game can be replayed exactly by reusing its seed. A random seed 
+            is chosen if not given
+
+        eligibility: 
+            Optional parameter, formatted as a dict where the game difficulty
+            is the key and the value is the Eligibility rule its prompts must
+            satisfy; DEFAULT_ELIGIBILITY is used if not given
     """
-    def __init__(self, data: pd.DataFrame):
+    __slots__ = ("corpus", "albums", "eligibility", "seed", "mode", "view", "sampler", 
+                 "rand_num", "start_line", "end_line", "prefetch", "buffer")
+
+    @timed
+    def __init__(self, data: Union[Corpus, pd.DataFrame], albums: Optional[List[str]]=None, 
+                 prefetch: int=5, seed: Optional[int]=None, 
+                 eligibility: Optional[Dict[str, Eligibility]]=None):
         """Constructor"""
 
-        self.data = data
+        self.corpus = data if isinstance(data, Corpus) else Corpus.from_dataframe(data)
+        self.albums = albums
+        self.eligibility = eligibility if eligibility is not None else DEFAULT_ELIGIBILITY
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.mode = None
+        self.view = None
+        self.sampler = None
         self.rand_num = None
         self.start_line = None
         self.end_line = None
+        self.prefetch = prefetch
+        self.buffer = deque()
 
-    def generate(self, mode: str) -> str:
+    def _set_mode(self, mode: str): 
         """
-        Method that returns the generated lyrics, given a game difficulty.
+        Switches the prompt space (and sampler) to the given mode's, dropping
+        any rounds prefetched for the previous mode.
+        """
+        self.mode = mode
+        eligible = self.corpus.eligible_rows(MODE_PROMPTS[mode], self.eligibility.get(mode))
+        self.view = AlbumView(self.corpus, self.albums, eligible)
+        self.sampler = PermutationSampler(len(self.view), self.seed)
+        self.buffer.clear()
+
+    def _sample_rows(self, n: int, mode: str) -> np.ndarray: 
+        """
+        Draws the rows of the next n prompts for the given mode.
+        """
+        if mode != self.mode: 
+            self._set_mode(mode)
+        return self.view.rows(self.sampler.draw_many(n))
+
+    def generate_batch(self, n: int, mode: str) -> List[Round]: 
+        """
+        Method that generates several rounds at once, given a game difficulty.
+        Sampling and the lyric windows are computed for the whole batch at once.
 
         Args:
+            n: 
+                The number of rounds to generate
+
             mode: 
                 A string specifying the game difficulty (i.e., whether to 
                 generate a whole section, 2 lines, or 1 line)
         
         Returns: 
-            An HTML-formatted string containing the generated lyrics.
+            A list of n fully resolved rounds.
         """
+        rows = self._sample_rows(n, mode)
+        start_lines, end_lines = self.corpus.prompt_windows(MODE_PROMPTS[mode], rows)
+        has_previous = start_lines > self.corpus.song_start[rows]
+        has_next = end_lines < self.corpus.song_end[rows]
 
-        self.rand_num = random.randint(0, self.data.shape[0] - 1)
-        track_name = self.data["track_name"][self.rand_num]
+        corpus = self.corpus
+        return [Round(lyrics="<br>".join(corpus.lyrics(start, end)),
+                      track_name=corpus.track_names[track],
+                      album_name=corpus.album_names[album],
+                      section=corpus.elements[element],
+                      previous_line=corpus.lyric(start - 1) if previous else "N/A",
+                      next_line=corpus.lyric(end + 1) if following else "N/A",
+                      row=row, start_line=start, end_line=end)
+                for row, start, end, track, album, element, previous, following 
+                in zip(rows.tolist(), start_lines.tolist(), end_lines.tolist(),
+                       corpus.track_codes[rows].tolist(), corpus.album_codes[rows].tolist(),
+                       corpus.element_codes[rows].tolist(), has_previous.tolist(), has_next.tolist())]
 
-        if mode == "Hard (1 line)": 
-            # regenerate the random number if the lyric is less than 3 words
-            while len(self.data["lyric"][self.rand_num].split(" ")) < 3:
-                self.rand_num = random.randint(0, self.data.shape[0] - 1)
+    def set_round(self, current: Round): 
+        """
+        Method that makes the given round the current one, i.e. the round 
+        that the getters and get_guess_feedback refer to.
+        """
+        self.rand_num = current.row
+        self.start_line = current.start_line
+        self.end_line = current.end_line
 
-            self.start_line = self.rand_num
-            self.end_line = self.rand_num
-            return self.data["lyric"][self.rand_num]
-        
-        if mode == "Medium (2 lines)": 
-            # check if next line is from same song; it not, give previous line
-            if ((self.rand_num <= self.data.shape[0] - 1) 
-                and (self.data["track_name"][self.rand_num + 1] == track_name)): 
-                self.start_line = self.rand_num
-                self.end_line = self.rand_num + 1
-            else: 
-                self.start_line = self.rand_num - 1
-                self.end_line = self.rand_num
-
-            return "<br>".join(self.data["lyric"][self.start_line:self.end_line + 1].tolist())
+    @timed
+    def next_round(self, mode: str) -> Round: 
+        """
+        Method that returns (and makes current) the next round, given a game
+        difficulty. Rounds are generated `prefetch` at a time, so most calls 
+        only pop a round off the buffer.
+
+        Args:
+            mode: 
+                A string specifying the game difficulty
+
+        Returns: 
+            The next round.
+        """
+        if mode != self.mode: 
+            self._set_mode(mode)
+        if not self.buffer: 
+            self.buffer.extend(self.generate_batch(self.prefetch, mode))
+        current = self.buffer.popleft()
+        self.set_round(current)
+        return current
+
+    def generate(self, mode: str) -> str:
+        """
+        Method that returns the generated lyrics, given a game difficulty.
+
+        Args:
+            mode: 
+                A string specifying the game difficulty (i.e., whether to 
+                generate a whole section, 2 lines, or 1 line)
         
-        else: 
-            rand_section = self.data["element"][self.rand_num]
-            # continue adding lines until section differs
-            self.start_line = self.rand_num
-            while ((self.start_line > 0) 
-                   and (self.data["element"][self.start_line - 1] == rand_section) 
-                   and (self.data["track_name"][self.start_line - 1] == track_name)): 
-                self.start_line -= 1
-
-            self.end_line = self.rand_num
-            while ((self.end_line < self.data.shape[0] - 1) 
-                   and (self.data["element"][self.end_line + 1] == rand_section)
-                   and (self.data["track_name"][self.end_line + 1] == track_name)): 
-                self.end_line += 1
-
-            return "<br>".join(self.data["lyric"][self.start_line:self.end_line + 1].tolist())
+        Returns: 
+            An HTML-formatted string containing the generated lyrics.
+        """
+        current = self.generate_batch(1, mode)[0]
+        self.set_round(current)
+        return current.lyrics
     
     def get_track_name(self) -> str: 
         """
@@ -82,7 +191,7 @@ class Lyrics():
         Returns: 
             The correct track name.
         """
-        return self.data["track_name"][self.rand_num]
+        return self.corpus.track_name(self.rand_num)
     
     def get_album_name(self) -> str: 
         """
@@ -91,7 +200,7 @@ class Lyrics():
         Returns: 
             The correct album name.
         """
-        return self.data["album_name"][self.rand_num]
+        return self.corpus.album_name(self.rand_num)
     
     def get_previous_line(self) -> str:
         """
@@ -102,8 +211,8 @@ class Lyrics():
             i.e., the generated lyrics was the very beginning of the song),
             "N/A" is returned.
         """
-        if (self.start_line > 0) and (self.data["track_name"][self.start_line - 1] == self.get_track_name()):
-            return self.data["lyric"][self.start_line - 1]
+        if self.start_line > self.corpus.song_start[self.rand_num]:
+            return self.corpus.lyric(self.start_line - 1)
         return "N/A"
 
     def get_next_line(self) -> str:
@@ -115,8 +224,8 @@ class Lyrics():
             following (i.e., the generated lyrics was the end of the song),
             "N/A" is returned.
         """
-        if (self.end_line < self.data.shape[0] - 1) and (self.data["track_name"][self.end_line + 1] == self.get_track_name()):
-            return self.data["lyric"][self.end_line + 1]
+        if self.end_line < self.corpus.song_end[self.rand_num]:
+            return self.corpus.lyric(self.end_line + 1)
         return "N/A"
     
     def get_section(self) -> str:
@@ -126,8 +235,9 @@ class Lyrics():
         Returns:
             The section (e.g. Chorus, Verse 1, etc.) of the generated lyrics.
         """
-        return self.data["element"][self.rand_num]
+        return self.corpus.element(self.rand_num)
     
+    @timed
     def get_guess_feedback(self, guess: str, 
                            acceptable_answers: Optional[dict]=None,
                            remove_parentheses: Optional[bool]=False, 
@@ -161,19 +271,6 @@ class Lyrics():
         Returns:
             A boolean; True if the guess is "correct," False otherwise.
         """
-        correct_song = self.get_track_name()
-        # other accepted answers - e.g. just "Gladiator" is accepted for Gladiator (Interlude)
-        accepted_songs = acceptable_answers[correct_song] if (acceptable_answers) and (correct_song in acceptable_answers) else []
-        # exceptions where the parentheses should be included in the guess
-        if remove_parentheses:
-            if correct_song not in keep_parentheses:
-                # remove parentheses (e.g. Taylor's Version) from track name
-                correct_song = re.sub(r"\([^)]*\)", "", correct_song).strip()
-        guess = guess.strip()
-        # allowing for minor typos
-        for accepted in [correct_song] + accepted_songs: 
-            track_name_length = len(accepted)
-            allowed_diff = math.ceil(track_name_length * 0.33)
-            if stringdist.levenshtein(guess.lower(), accepted.lower()) <= allowed_diff: 
-                return True
-        return False
\ No newline at end of file
+        matcher = load_shared_matcher(self.corpus.track_names, acceptable_answers, 
+                                      remove_parentheses, keep_parentheses)
+        return matcher.is_correct(guess, self.get_track_name())
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from servertools.Timing import LatencyHistogram, histograms, TIMING_ENABLED
+
+# the metrics are served (in the Prometheus text format) on this local port if
+# TAYLYRICS_METRICS_PORT is set; they are recorded either way
+METRICS_PORT = int(os.environ.get("TAYLYRICS_METRICS_PORT", "0")) or None
+METRICS_HOST = os.environ.get("TAYLYRICS_METRICS_HOST", "127.0.0.1")
+# a session counts as active if it has rerun within this many seconds
+ACTIVE_SESSION_TIMEOUT = 300
+
+class Counter():
+    """
+    Class that counts something that only goes up (e.g. rounds served).
+    """
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        """Constructor"""
+
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float=1):
+        """
+        Adds the given amount to the count.
+        """
+        with self._lock:
+            self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+class Gauge():
+    """
+    Class that holds a value that can go up and down (e.g. active sessions).
+    If function is given, the value is whatever it returns when read.
+    """
+    __slots__ = ("value", "function")
+
+    def __init__(self, function: Optional[Callable[[], float]]=None):
+        """Constructor"""
+
+        self.value = 0.0
+        self.function = function
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+    def time(self) -> "_Timer":
+        """
+        Returns a context manager that sets the gauge to the number of
+        seconds spent in it.
+        """
+        return _Timer(self.set)
+
+class Histogram(LatencyHistogram):
+    """
+    Class that counts latencies (in seconds) in fixed buckets; see
+    LatencyHistogram.
+    """
+    __slots__ = ()
+
+    def time(self) -> "_Timer":
+        """
+        Returns a context manager that records the number of seconds spent
+        in it.
+        """
+        return _Timer(self.observe)
+
+class _Timer():
+    __slots__ = ("record", "start")
+
+    def __init__(self, record: Callable[[float], None]):
+        self.record = record
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.record(time.perf_counter() - self.start)
+
+_KINDS = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+class MetricFamily():
+    """
+    Class that holds one metric per combination of label values, e.g. one
+    counter of guesses per result. Metrics without labels have a single
+    member, for no label values.
+
+    Args:
+        name:
+            The metric's name, e.g. "taylyrics_rounds_served_total"
+
+        help:
+            A description of the metric
+
+        kind:
+            "counter", "gauge" or "histogram"
+
+        labelnames:
+            The names of the metric's labels
+    """
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...]=()):
+        """Constructor"""
+
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.members: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """
+        Returns the metric for the given label values (in the order of
+        labelnames), creating it on first use. Looking a metric up is a dict
+        lookup; metrics used on every call can be looked up once, ahead of time.
+        """
+        member = self.members.get(values)
+        if member is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} has labels {self.labelnames}, got {values}")
+            with self._lock:
+                member = self.members.setdefault(values, _KINDS[self.kind]())
+        return member
+
+    def render(self) -> List[str]:
+        """
+        Returns the lines of the Prometheus text format describing the family.
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, member in list(self.members.items()):
+            labels = list(zip(self.labelnames, values))
+            if self.kind == "histogram":
+                lines.extend(render_histogram(self.name, labels, member))
+            else:
+                lines.append(f"{self.name}{format_labels(labels)} {format_value(member.get())}")
+        return lines
+
+_REGISTRY: Dict[str, MetricFamily] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def register(name: str, help: str, kind: str, labelnames: Tuple[str, ...]=()):
+    """
+    Returns the process-wide metric of the given name, registering it on
+    first use: the MetricFamily if it has labels, otherwise the metric itself.
+    """
+    with _REGISTRY_LOCK:
+        family = _REGISTRY.setdefault(name, MetricFamily(name, help, kind, labelnames))
+    return family if labelnames else family.labels()
+
+def format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+def render_histogram(name: str, labels: List[Tuple[str, str]], histogram: LatencyHistogram) -> List[str]:
+    lines = [f"{name}_bucket{format_labels(labels + [('le', format_value(bound))])} {count}"
+             for bound, count in histogram.cumulative()]
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    return lines
+
+def render() -> str:
+    """
+    Returns every metric in the Prometheus text format, along with the
+    latencies recorded by servertools.Timing if timing is enabled.
+    """
+    with _REGISTRY_LOCK:
+        families = list(_REGISTRY.values())
+    lines = [line for family in families for line in family.render()]
+    if TIMING_ENABLED:
+        name = "taylyrics_operation_seconds"
+        lines += [f"# HELP {name} The latency of each timed operation (see servertools.Timing)",
+                  f"# TYPE {name} histogram"]
+        for operation, histogram in histograms().items():
+            lines.extend(render_histogram(name, [("operation", operation)], histogram))
+    return "\n".join(lines) + "\n"
+
+class ActiveSessions():
+    """
+    Class that keeps the last time each session was seen, to count the
+    sessions seen within the last timeout seconds. Streamlit does not report
+    when a session ends, so a session that has not rerun for a while is
+    taken to be gone.
+
+    Args:
+        timeout:
+            The number of seconds a session counts as active after it was
+            last seen
+    """
+    def __init__(self, timeout: float=ACTIVE_SESSION_TIMEOUT):
+        """Constructor"""
+
+        self.timeout = timeout
+        self.last_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: str):
+        """
+        Records that the given session was just seen.
+        """
+        self.last_seen[session_id] = time.monotonic()
+
+    def count(self) -> int:
+        """
+        Returns the number of active sessions, forgetting the others.
+        """
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            for session_id, seen in list(self.last_seen.items()):
+                if seen < cutoff:
+                    del self.last_seen[session_id]
+            return len(self.last_seen)
+
+### METRICS ###
+ACTIVE_SESSIONS = ActiveSessions()
+register("taylyrics_active_sessions", f"The number of sessions seen within the last {ACTIVE_SESSION_TIMEOUT} seconds",
+         "gauge").function = ACTIVE_SESSIONS.count
+ROUNDS_SERVED = register("taylyrics_rounds_served_total", "The number of rounds served", "counter", ("difficulty",))
+GUESSES_CHECKED = register("taylyrics_guesses_checked_total", "The number of guesses checked", "counter", ("result",))
+GUESSES_CORRECT = GUESSES_CHECKED.labels("correct")
+GUESSES_INCORRECT = GUESSES_CHECKED.labels("incorrect")
+HINTS = register("taylyrics_hints_total", "The number of hints taken", "counter")
+GIVE_UPS = register("taylyrics_give_ups_total", "The number of rounds given up", "counter")
+LEADERBOARD_QUERY_SECONDS = register("taylyrics_leaderboard_query_seconds",
+                                     "The latency of leaderboard queries that reach the database",
+                                     "histogram", ("query",))
+LEADERBOARD_COMMIT_SECONDS = register("taylyrics_leaderboard_commit_seconds",
+                                      "The latency of leaderboard commits", "histogram")
+LEADERBOARD_SUBMISSIONS = register("taylyrics_leaderboard_submissions_total",
+                                   "The number of results added to the leaderboards", "counter")
+CORPUS_LOAD_SECONDS = register("taylyrics_corpus_load_seconds", "How long the last corpus load took", "gauge")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes would otherwise be logged to stderr every few seconds
+        pass
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+_SERVER_STARTED = False
+_SERVER_LOCK = threading.Lock()
+
+def start_metrics_server(port: Optional[int]=METRICS_PORT, host: str=METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves the metrics (see render) at /metrics on the given port, from a
+    background thread, unless they already are (or no port is given). If the
+    port cannot be bound (e.g. another worker on the same host took it), a
+    warning is printed and the app carries on without serving them.
+
+    Returns:
+        The server, or None if the metrics are not served.
+    """
+    global _SERVER, _SERVER_STARTED
+    if port is None:
+        return None
+    with _SERVER_LOCK:
+        # only tried once per process, since the app calls this on every rerun
+        if not _SERVER_STARTED:
+            _SERVER_STARTED = True
+            try:
+                _SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Could not serve metrics on {host}:{port}: {e}", file=sys.stderr)
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, name="MetricsServer", daemon=True).start()
+        return _SERVER
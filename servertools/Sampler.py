@@ -0,0 +1,111 @@
+import math
+import random
+import numpy as np
+from typing import List, Optional
+
+_MASK64 = (1 << 64) - 1
+_FEISTEL_ROUNDS = 4
+
+def _splitmix64(x: int) -> int:
+    """
+    The SplitMix64 finalizer; used to derive well-mixed round keys from a seed.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+def _round_function(values: np.ndarray, key: int) -> np.ndarray:
+    """
+    The Feistel round function: a keyed 64-bit mix of an array of values.
+    """
+    values = values ^ np.uint64(key)
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(31))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(29))
+
+class PermutationSampler():
+    """
+    Class that draws indices from range(size) without replacement, in a
+    random order determined by a seed. Once every index has been drawn, a new
+    permutation is started.
+
+    Rather than storing a shuffled list, the i-th index drawn is computed by
+    encrypting i with a small Feistel network over the smallest power of 4
+    that is at least size, re-encrypting ("cycle-walking") until the result
+    falls within range(size). Each draw is therefore O(1) (in expectation),
+    and the sampler's entire state is four integers.
+
+    Args:
+        size:
+            The number of indices to draw from
+
+        seed:
+            Optional parameter specifying the seed; the same seed always
+            yields the same sequence of draws. A random seed is chosen if
+            not given
+    """
+    __slots__ = ("size", "seed", "epoch", "position")
+
+    def __init__(self, size: int, seed: Optional[int]=None):
+        """Constructor"""
+
+        if size < 1:
+            raise ValueError("PermutationSampler requires a size of at least 1")
+        self.size = size
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        # the number of completed permutations, and the position within the current one
+        self.epoch = 0
+        self.position = 0
+
+    def _round_keys(self) -> List[int]:
+        epoch_key = _splitmix64(self.seed ^ _splitmix64(self.epoch))
+        return [_splitmix64(epoch_key + i) for i in range(_FEISTEL_ROUNDS)]
+
+    def _permute(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Maps positions of the current permutation to the indices drawn there.
+        """
+        half_bits = max(1, math.ceil((self.size - 1).bit_length() / 2))
+        half_mask = np.uint64((1 << half_bits) - 1)
+        shift = np.uint64(half_bits)
+        keys = self._round_keys()
+
+        def encrypt(values: np.ndarray) -> np.ndarray:
+            left, right = values >> shift, values & half_mask
+            for key in keys:
+                left, right = right, left ^ (_round_function(right, key) & half_mask)
+            return (left << shift) | right
+
+        indices = encrypt(positions)
+        outside = indices >= self.size
+        while outside.any():
+            indices[outside] = encrypt(indices[outside])
+            outside = indices >= self.size
+        return indices
+
+    def draw_many(self, n: int) -> np.ndarray:
+        """
+        Draws the next n indices.
+
+        Returns:
+            An array of n indices in range(size).
+        """
+        draws = []
+        while n > 0:
+            take = min(n, self.size - self.position)
+            positions = np.arange(self.position, self.position + take, dtype=np.uint64)
+            draws.append(self._permute(positions).astype(np.int64))
+            self.position += take
+            n -= take
+            if self.position == self.size:
+                self.epoch += 1
+                self.position = 0
+        return np.concatenate(draws) if draws else np.empty(0, dtype=np.int64)
+
+    def draw(self) -> int:
+        """
+        Draws the next index.
+        """
+        return int(self.draw_many(1)[0])
@@ -0,0 +1,110 @@
+from typing import Dict, NamedTuple, Optional
+
+class ScoreStats(NamedTuple):
+    """
+    Where a score stands among all the scores on a leaderboard.
+    """
+    # 1 + the number of strictly higher scores (tied scores share a rank)
+    rank: int
+    # the number of strictly higher scores
+    beat_you: int
+    # the total number of scores
+    total: int
+    # the percentage of scores that are strictly lower
+    percentile: float
+
+class ScoreDistribution():
+    """
+    Class that counts the scores (points) on a leaderboard, in a Fenwick
+    (binary indexed) tree indexed by points, so that adding a score and
+    counting the scores above or below one are both O(log range), where
+    range is the spread of the points. The tree doubles in size whenever a 
+    score above its range is added; scores below its range (points can be
+    negative) are rare, and rebuild it.
+
+    Args:
+        counts:
+            Optional parameter, formatted as a dict where the points are the
+            key and the value is the number of scores with those points
+    """
+    __slots__ = ("tree", "total", "minimum")
+
+    def __init__(self, counts: Optional[Dict[int, int]]=None):
+        """Constructor"""
+
+        # tree[i] holds the number of scores in (i - lowbit(i), i], where
+        # index i counts scores of minimum + i - 1 points; tree[0] is unused
+        counts = counts or {}
+        self.tree = [0] * 65
+        self.total = 0
+        self.minimum = min(0, min(counts, default=0))
+        for points, count in counts.items():
+            self.add(points, count)
+
+    def _grow(self, size: int):
+        """
+        Doubles the tree until it covers indices up to size. For a
+        power-of-2 size n, the nodes up to n keep their ranges when the
+        tree doubles, node 2n covers everything, and the new nodes in
+        between cover no scores yet.
+        """
+        while len(self.tree) - 1 < size:
+            n = len(self.tree) - 1
+            self.tree.extend([0] * n)
+            self.tree[2 * n] = self.total
+
+    def _lower_minimum(self, points: int):
+        """
+        Rebuilds the tree so that its range starts at (or below) the given 
+        points, extending it downwards by at least its current size so that
+        rebuilds stay rare.
+        """
+        counts = {}
+        for index in range(1, len(self.tree)):
+            count = self.count_at_most(self.minimum + index - 1) - self.count_at_most(self.minimum + index - 2)
+            if count:
+                counts[self.minimum + index - 1] = count
+        self.tree = [0] * len(self.tree)
+        self.total = 0
+        self.minimum = min(points, self.minimum - (len(self.tree) - 1))
+        for existing, count in counts.items():
+            self.add(existing, count)
+
+    def add(self, points: int, count: int=1):
+        """
+        Adds count scores of the given points.
+        """
+        if points < self.minimum:
+            self._lower_minimum(points)
+        index = points - self.minimum + 1
+        self._grow(index)
+        while index < len(self.tree):
+            self.tree[index] += count
+            index += index & -index
+        self.total += count
+
+    def count_at_most(self, points: int) -> int:
+        """
+        Returns the number of scores of at most the given points.
+        """
+        index = min(points - self.minimum + 1, len(self.tree) - 1)
+        count = 0
+        while index > 0:
+            count += self.tree[index]
+            index -= index & -index
+        return count
+
+    def count_above(self, points: int) -> int:
+        """
+        Returns the number of scores of strictly more than the given points.
+        """
+        return self.total - self.count_at_most(points)
+
+    def stats(self, points: int) -> ScoreStats:
+        """
+        Returns where a score of the given points stands among the scores.
+        """
+        beat_you = self.count_above(points)
+        below = self.count_at_most(points - 1)
+        percentile = 100 * below / self.total if self.total else 0.0
+        return ScoreStats(rank=beat_you + 1, beat_you=beat_you, total=self.total, percentile=percentile)
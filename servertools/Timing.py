@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import atexit
+import bisect
+import cProfile
+import threading
+import functools
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+# timing is switched on by setting TAYLYRICS_TIMING (to anything but 0) in the
+# environment before the app starts; when it is off, timed returns functions
+# unchanged, so there is no overhead at all
+TIMING_ENABLED = os.environ.get("TAYLYRICS_TIMING", "") not in ("", "0")
+# setting TAYLYRICS_PROFILE to a directory profiles (with cProfile and
+# tracemalloc) the first session that starts, for PROFILE_RERUNS reruns
+PROFILE_DIR = os.environ.get("TAYLYRICS_PROFILE") or None
+PROFILE_RERUNS = int(os.environ.get("TAYLYRICS_PROFILE_RERUNS", "100"))
+
+# the upper bounds (in seconds) of the histogram buckets; a last bucket holds
+# everything slower
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+           0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class LatencyHistogram():
+    """
+    Class that counts latencies in fixed buckets (see BUCKETS), along with
+    their count, sum and maximum. Recording a latency is a binary search and
+    a few additions, so it is cheap enough to do on every call.
+    """
+    __slots__ = ("counts", "count", "sum", "max", "_lock")
+
+    def __init__(self):
+        """Constructor"""
+
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """
+        Records a latency of the given number of seconds.
+        """
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """
+        Returns the number of latencies of at most each bucket's upper bound,
+        formatted as a list of tuples (upper bound, count), ending with
+        (inf, total count).
+        """
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        cumulative = []
+        for bound, count in zip(BUCKETS + (float("inf"),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns an estimate of the given quantile (between 0 and 1), 
+        interpolating linearly within the bucket it falls in (as Prometheus'
+        histogram_quantile does), and capped at the maximum.
+        """
+        cumulative = self.cumulative()
+        target = q * cumulative[-1][1]
+        lower, below = 0.0, 0
+        for bound, count in cumulative:
+            if count >= target and count > below:
+                return min(lower + (bound - lower) * (target - below) / (count - below), self.max)
+            lower, below = bound, count
+        return 0.0
+
+_HISTOGRAMS: Dict[str, LatencyHistogram] = {}
+_HISTOGRAMS_LOCK = threading.Lock()
+
+def get_histogram(operation: str) -> LatencyHistogram:
+    """
+    Returns the process-wide latency histogram of the given operation,
+    creating it on first use.
+    """
+    histogram = _HISTOGRAMS.get(operation)
+    if histogram is None:
+        with _HISTOGRAMS_LOCK:
+            histogram = _HISTOGRAMS.setdefault(operation, LatencyHistogram())
+    return histogram
+
+def histograms() -> Dict[str, LatencyHistogram]:
+    """
+    Returns the latency histogram of every timed operation, by operation.
+    """
+    with _HISTOGRAMS_LOCK:
+        return dict(_HISTOGRAMS)
+
+def timed(fn: Callable) -> Callable:
+    """
+    Decorator that records the latency of every call of the decorated
+    function in the histogram of its qualified name (e.g.
+    "Lyrics.next_round"), if timing is enabled. If it is not, the function
+    is returned as is.
+    """
+    if not TIMING_ENABLED:
+        return fn
+    histogram = get_histogram(fn.__qualname__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+def timing_report() -> str:
+    """
+    Returns a table of the calls, mean, p50, p90, p99 and maximum latency
+    (in milliseconds) of every timed operation, slowest (in total) first.
+    """
+    by_total = sorted(histograms().items(), key=lambda item: item[1].sum, reverse=True)
+    lines = [f"{'operation':<40}{'calls':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+    for operation, histogram in by_total:
+        if not histogram.count:
+            continue
+        mean = histogram.sum / histogram.count
+        stats = [mean] + [histogram.quantile(q) for q in (0.5, 0.9, 0.99)] + [histogram.max]
+        lines.append(f"{operation:<40}{histogram.count:>8}" + "".join(f"{value * 1e3:>10.2f}" for value in stats))
+    return "\n".join(lines)
+
+if TIMING_ENABLED:
+    atexit.register(lambda: print(timing_report(), file=sys.stderr))
+
+class SessionProfiler():
+    """
+    Class that profiles one session's reruns (and callbacks) with cProfile,
+    and the memory allocated over them with tracemalloc. The profile is
+    written once the given number of reruns have finished (or at exit), to
+    session-<start time>.prof (which can be read with pstats or snakeviz) and
+    the top allocations to session-<start time>.alloc.txt, in output_dir.
+
+    cProfile only sees the thread it is started in, so start is called at the
+    beginning of every rerun and callback, and stop (or, at the end of a
+    rerun, end_rerun) once it is done. tracemalloc traces the whole process,
+    so the allocations include those of any other sessions running at the
+    same time.
+
+    Args:
+        output_dir:
+            The directory to write the profile to
+
+        reruns:
+            The number of reruns to profile
+    """
+    def __init__(self, output_dir: str, reruns: int=PROFILE_RERUNS):
+        """Constructor"""
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, f"session-{int(time.time())}")
+        self.reruns = reruns
+        self.profile = cProfile.Profile()
+        self.done = False
+        # the thread currently being profiled, and how many (nested) starts
+        # it has made; a rerun interrupted by st.rerun never calls stop, so
+        # the count restarts when the next rerun starts in a new thread
+        self._thread = None
+        self._depth = 0
+        self._lock = threading.Lock()
+        tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+        atexit.register(self.dump)
+
+    def start(self):
+        """
+        Starts (or, if nested, continues) profiling the current thread.
+        """
+        with self._lock:
+            if self.done:
+                return
+            if self._thread is not threading.current_thread():
+                self._thread = threading.current_thread()
+                self._depth = 0
+            self._depth += 1
+            if self._depth == 1:
+                self.profile.enable()
+
+    def stop(self):
+        """
+        Stops profiling the current thread, once every start is matched.
+        """
+        with self._lock:
+            if self.done or self._thread is not threading.current_thread():
+                return
+            self._depth -= 1
+            if self._depth == 0:
+                self.profile.disable()
+
+    def end_rerun(self):
+        """
+        Stops profiling at the end of a rerun; the profile is written after
+        the last one.
+        """
+        self.stop()
+        self.reruns -= 1
+        if self.reruns <= 0:
+            self.dump()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def dump(self):
+        """
+        Writes the profile and the top allocations, and stops profiling.
+        """
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+            self.profile.disable()
+        self.profile.dump_stats(f"{self.path}.prof")
+        allocations = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+        tracemalloc.stop()
+        with open(f"{self.path}.alloc.txt", "w") as f:
+            f.write("\n".join(str(allocation) for allocation in allocations[:50]) + "\n")
+
+_PROFILER_CLAIMED = False
+_PROFILER_LOCK = threading.Lock()
+
+def claim_session_profiler() -> Optional[SessionProfiler]:
+    """
+    Returns a SessionProfiler for the first session to call this in the
+    process, if profiling is enabled (see PROFILE_DIR); otherwise None.
+    """
+    global _PROFILER_CLAIMED
+    if PROFILE_DIR is None or _PROFILER_CLAIMED:
+        return None
+    with _PROFILER_LOCK:
+        if _PROFILER_CLAIMED:
+            return None
+        _PROFILER_CLAIMED = True
+    return SessionProfiler(PROFILE_DIR)
@@ -0,0 +1,417 @@
+import math
+import re
+import threading
+import stringdist
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# the fraction of an answer's length that a guess may differ from it by
+TYPO_TOLERANCE = 0.33
+# answers longer than this do not fit in a 64-bit match mask, and are compared
+# with batch_levenshtein instead
+_MAX_BIT_PARALLEL_LENGTH = 63
+
+# matchers shared by every session in the process, keyed by their arguments
+_SHARED_MATCHERS: Dict[tuple, "TitleMatcher"] = {}
+_SHARED_MATCHERS_LOCK = threading.Lock()
+
+def normalize_guess(guess: str) -> str:
+    """
+    Normalizes a guess the way answers are normalized (whitespace and
+    capitalization are ignored).
+    """
+    return guess.strip().lower()
+
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    Returns the Levenshtein distance between two strings if it is at most
+    max_distance, and max_distance + 1 otherwise. Strings whose lengths 
+    differ by more than max_distance are rejected without any computation
+    (so garbage input, e.g. a pasted verse, is rejected almost immediately),
+    and the computation stops as soon as the distance can no longer come 
+    back within max_distance.
+
+    Args:
+        a, b: 
+            The strings to compare
+
+        max_distance: 
+            The largest distance of interest
+
+    Returns:
+        The distance, capped at max_distance + 1.
+    """
+    if a == b: 
+        return 0
+    # the distance is at least the difference in lengths
+    if abs(len(a) - len(b)) > max_distance: 
+        return max_distance + 1
+
+    # a common prefix or suffix never affects the distance
+    start = 0
+    shortest = min(len(a), len(b))
+    while start < shortest and a[start] == b[start]: 
+        start += 1
+    end = 0
+    while end < shortest - start and a[-1 - end] == b[-1 - end]: 
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if len(a) > len(b): 
+        a, b = b, a
+    if not a: 
+        return len(b)
+
+    # Myers' bit-parallel algorithm: bit i of the vertical delta vectors 
+    # (positive/negative) holds D[i + 1][j] - D[i][j] of the current column 
+    # j, and the band shows up as the early exit below
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    matches: Dict[str, int] = {}
+    for i, a_char in enumerate(a): 
+        matches[a_char] = matches.get(a_char, 0) | (1 << i)
+    positive, negative = full, 0
+    distance = len(a)
+    remaining = len(b)
+    for b_char in b: 
+        match = matches.get(b_char, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last: 
+            distance += 1
+        elif horizontal_negative & last: 
+            distance -= 1
+        # each remaining character can lower the distance by at most 1
+        remaining -= 1
+        if distance - remaining > max_distance: 
+            return max_distance + 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+    return distance if distance <= max_distance else max_distance + 1
+
+def _encode(words: List[str], fill: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes strings as a padded array of code points, returning it along
+    with the strings' lengths.
+    """
+    lengths = np.array([len(word) for word in words], dtype=np.int64)
+    codes = np.full((len(words), max(lengths.max(initial=0), 1)), fill, dtype=np.int32)
+    for i, word in enumerate(words): 
+        codes[i, :len(word)] = [ord(char) for char in word]
+    return codes, lengths
+
+def batch_levenshtein(a: List[str], b: List[str]) -> np.ndarray:
+    """
+    Returns the Levenshtein distances between each pair of strings (a[i], 
+    b[i]), computing the DP tables of all pairs at once. Each row of a DP 
+    table is computed in one step: deletions and substitutions depend only on
+    the previous row, and insertions are resolved with a cumulative minimum
+    (D[i][j] = min over k <= j of T[k] + j - k).
+    """
+    distances = np.zeros(len(a), dtype=np.int64)
+    if not len(a): 
+        return distances
+    # padding never matches, and cells beyond a string's length are never read
+    a_codes, a_lengths = _encode(a, fill=-1)
+    b_codes, b_lengths = _encode(b, fill=-2)
+    # distances never exceed the longer string's length
+    dtype = np.int16 if max(a_codes.shape[1], b_codes.shape[1]) < np.iinfo(np.int16).max else np.int32
+    columns = np.arange(b_codes.shape[1] + 1, dtype=dtype)
+    pairs = np.arange(len(a))
+
+    previous = np.broadcast_to(columns, (len(a), len(columns))).astype(dtype)
+    distances[a_lengths == 0] = b_lengths[a_lengths == 0]
+    for i in range(1, int(a_lengths.max()) + 1): 
+        mismatch = a_codes[:, i - 1, None] != b_codes
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(previous[:, :-1] + mismatch, previous[:, 1:] + 1)
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+        finished = a_lengths == i
+        distances[finished] = current[pairs[finished], b_lengths[finished]]
+        previous = current
+    return distances
+
+def _bit_parallel_levenshtein(texts: np.ndarray, text_lengths: np.ndarray, 
+                              match_masks: np.ndarray, pattern_lengths: np.ndarray) -> np.ndarray:
+    """
+    Returns the Levenshtein distances of many (text, pattern) pairs at once,
+    using Myers' bit-parallel algorithm (see bounded_levenshtein) with one 
+    64-bit word per pair, so patterns can be at most 63 characters long.
+
+    Args:
+        texts: 
+            A (pairs, length) array of the texts' characters, as indices
+            into the alphabet that match_masks is indexed by
+
+        text_lengths: 
+            The length of each text
+
+        match_masks: 
+            A (pairs, alphabet) array, where bit i of match_masks[p, c] is set
+            if character i of pair p's pattern is character c
+
+        pattern_lengths: 
+            The length of each pattern
+    """
+    one = np.uint64(1)
+    lengths = pattern_lengths.astype(np.uint64)
+    full = (one << lengths) - one
+    last = np.where(pattern_lengths > 0, one << np.maximum(lengths, one) - one, np.uint64(0))
+    pairs = np.arange(len(texts))
+
+    positive = full.copy()
+    negative = np.zeros_like(full)
+    distances = pattern_lengths.astype(np.int64)
+    for j in range(texts.shape[1]): 
+        match = match_masks[pairs, texts[:, j]]
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        active = j < text_lengths
+        distances += active & ((horizontal_positive & last) != 0)
+        distances -= active & ((horizontal_negative & last) != 0)
+        horizontal_positive = ((horizontal_positive << one) | one) & full
+        horizontal_negative = (horizontal_negative << one) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+    return np.where(pattern_lengths > 0, distances, text_lengths)
+
+def _bigrams(word: str) -> List[str]:
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+class _BigramIndex():
+    """
+    An index of the character bigrams of a set of strings, used to find the
+    string closest (by Levenshtein distance) to a query while computing as 
+    few distances as possible.
+
+    A single edit changes at most 2 of a string's bigrams, so if strings a 
+    and b share c bigrams, their distance is at least 
+    (max(len(a), len(b)) - 1 - c) / 2. The lower bounds against every string
+    are computed at once from an inverted index of bigrams, and distances are 
+    then computed in order of increasing lower bound until no remaining 
+    string can be closer than the best found.
+    """
+    def __init__(self, words: Iterable[str]):
+        """Constructor"""
+
+        self.words = list(words)
+        self.lengths = np.array([len(word) for word in self.words])
+        # for each bigram, the words containing it and how many times they do
+        postings: Dict[str, Dict[int, int]] = {}
+        for i, word in enumerate(self.words): 
+            for bigram in _bigrams(word): 
+                counts = postings.setdefault(bigram, {})
+                counts[i] = counts.get(i, 0) + 1
+        self.postings = {bigram: (np.array(list(counts.keys())), np.array(list(counts.values())))
+                         for bigram, counts in postings.items()}
+
+    def closest(self, query: str, max_distance: float=math.inf) -> Tuple[Optional[str], float]:
+        """
+        Returns the word closest to the query (and its distance), considering
+        only words within max_distance of it.
+        """
+        shared = np.zeros(len(self.words), dtype=np.int64)
+        for bigram, query_count in Counter(_bigrams(query)).items(): 
+            if bigram in self.postings: 
+                word_ids, counts = self.postings[bigram]
+                shared[word_ids] += np.minimum(counts, query_count)
+        longest = np.maximum(self.lengths, len(query))
+        lower_bounds = np.maximum(np.abs(self.lengths - len(query)), 
+                                  -(-(longest - 1 - shared) // 2))
+
+        best_word, best_distance = None, max_distance
+        for i in np.argsort(lower_bounds, kind="stable").tolist(): 
+            if lower_bounds[i] > best_distance or (lower_bounds[i] == best_distance and best_word is not None): 
+                break
+            distance = stringdist.levenshtein(query, self.words[i])
+            if distance < best_distance or (distance == best_distance and best_word is None):
+                best_word, best_distance = self.words[i], distance
+        return best_word, best_distance
+
+class TitleMatcher():
+    """
+    Class that checks guesses against track titles. Each title's accepted
+    answers (its canonical form plus any aliases) are normalized once, and a
+    bigram index over all answers finds the title closest to a guess.
+
+    Args:
+        titles:
+            The track titles (e.g. Corpus.track_names)
+
+        acceptable_answers:
+            Optional parameter, formatted as a dict where the correct song is
+            the key and the value is a list of acceptable answers, used to
+            specify acceptable answers for given songs
+
+        remove_parentheses:
+            Optional parameter used to specify whether to remove parentheses
+            within song titles
+
+        keep_parentheses:
+            When remove_parentheses is True, this is an optional parameter
+            used to specify songs where the parentheses should not be removed
+    """
+    def __init__(self, titles: Iterable[str],
+                 acceptable_answers: Optional[dict]=None,
+                 remove_parentheses: Optional[bool]=False,
+                 keep_parentheses: Optional[List]=None):
+        """Constructor"""
+
+        acceptable_answers = acceptable_answers or {}
+        keep_parentheses = keep_parentheses or []
+
+        self.titles = list(titles)
+        self.title_ids = {title: i for i, title in enumerate(self.titles)}
+        # per title, its accepted answers as (normalized answer, allowed typos)
+        self.answers: List[List[Tuple[str, int]]] = []
+        # every normalized answer, mapped to the first title it belongs to
+        self.answer_titles: Dict[str, int] = {}
+        for title_id, title in enumerate(self.titles):
+            canonical = title
+            if remove_parentheses and title not in keep_parentheses:
+                # remove parentheses (e.g. Taylor's Version) from track name
+                canonical = re.sub(r"\([^)]*\)", "", title).strip()
+            answers = []
+            for accepted in [canonical] + acceptable_answers.get(title, []):
+                allowed_diff = math.ceil(len(accepted) * TYPO_TOLERANCE)
+                answers.append((accepted.lower(), allowed_diff))
+                self.answer_titles.setdefault(accepted.lower(), title_id)
+            self.answers.append(answers)
+        self.index = _BigramIndex(self.answer_titles)
+
+        # for batch evaluation: each distinct answer's match masks (see 
+        # _bit_parallel_levenshtein) over the characters used by any answer,
+        # where character 0 stands for every other character
+        self.answer_ids = {answer: i for i, answer in enumerate(self.answer_titles)}
+        alphabet = sorted(set("".join(self.answer_ids)))
+        # maps a code point to its character's index in the alphabet
+        self.alphabet_lookup = np.zeros(max(map(ord, alphabet), default=0) + 1, dtype=np.int64)
+        self.alphabet_lookup[[ord(char) for char in alphabet]] = np.arange(1, len(alphabet) + 1)
+        self.match_masks = np.zeros((len(self.answer_ids), len(alphabet) + 1), dtype=np.uint64)
+        for answer, answer_id in self.answer_ids.items(): 
+            if len(answer) <= _MAX_BIT_PARALLEL_LENGTH: 
+                for position, char in enumerate(answer): 
+                    self.match_masks[answer_id, self.alphabet_lookup[ord(char)]] |= np.uint64(1 << position)
+
+    def is_correct(self, guess: str, title: str) -> bool:
+        """
+        Returns whether a guess is correct for a given title. Capitalization
+        is waived, as are minor (within 1/3 of the answer's length) spelling
+        mistakes.
+        """
+        guess = normalize_guess(guess)
+        return any(bounded_levenshtein(guess, answer, allowed_diff) <= allowed_diff
+                   for answer, allowed_diff in self.answers[self.title_ids[title]])
+
+    def evaluate_guesses(self, guesses: List[str], track_ids: List[int], 
+                         batch_size: int=4096) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores many (guess, correct title) pairs at once, e.g. to replay 
+        logged guesses. The result for each pair is the same as is_correct's.
+
+        Args:
+            guesses: 
+                The guesses, as strings
+
+            track_ids: 
+                For each guess, the index of the correct title in titles 
+                (i.e., the track code in the Corpus)
+
+            batch_size: 
+                The number of (guess, answer) comparisons computed together;
+                comparisons are batched by guess length so that one long 
+                guess does not slow down the rest
+
+        Returns:
+            A tuple (correct, distances) of arrays, where correct[i] is 
+            whether guess i is correct, and distances[i] is its edit distance
+            to the closest of the title's accepted answers.
+        """
+        # one comparison per (guess, accepted answer) 
+        guess_ids, answer_ids, allowed = [], [], []
+        for guess_id, track_id in enumerate(track_ids): 
+            for answer, allowed_diff in self.answers[track_id]: 
+                guess_ids.append(guess_id)
+                answer_ids.append(self.answer_ids[answer])
+                allowed.append(allowed_diff)
+        guess_ids = np.array(guess_ids, dtype=np.int64)
+        answer_ids = np.array(answer_ids, dtype=np.int64)
+        allowed = np.array(allowed, dtype=np.int64)
+
+        normalized = [normalize_guess(guess) for guess in guesses]
+        guess_lengths = np.array([len(guess) for guess in normalized], dtype=np.int64)
+        guess_starts = np.concatenate([[0], np.cumsum(guess_lengths)])
+        # every guess' characters as alphabet indices, concatenated 
+        code_points = np.frombuffer("".join(normalized).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+        known = code_points < len(self.alphabet_lookup)
+        # (with a trailing 0, so that padding can always be gathered)
+        characters = np.append(np.where(known, self.alphabet_lookup[np.where(known, code_points, 0)], 0), 0)
+        answers = list(self.answer_ids)
+        answer_lengths = np.array([len(answer) for answer in answers], dtype=np.int64)
+
+        comparison_distances = np.zeros(len(guess_ids), dtype=np.int64)
+        bit_parallel = answer_lengths[answer_ids] <= _MAX_BIT_PARALLEL_LENGTH
+        order = np.flatnonzero(bit_parallel)
+        order = order[np.argsort(guess_lengths[guess_ids[order]], kind="stable")]
+        for start in range(0, len(order), batch_size): 
+            batch = order[start:start + batch_size]
+            batch_guesses = guess_ids[batch]
+            positions = np.arange(max(guess_lengths[batch_guesses].max(), 1))
+            in_guess = positions < guess_lengths[batch_guesses, None]
+            texts = np.where(in_guess, characters[np.where(in_guess, guess_starts[batch_guesses, None] + positions, 0)], 0)
+            comparison_distances[batch] = _bit_parallel_levenshtein(texts, guess_lengths[batch_guesses],
+                                                                    self.match_masks[answer_ids[batch]],
+                                                                    answer_lengths[answer_ids[batch]])
+        for start in range(0, int((~bit_parallel).sum()), batch_size): 
+            batch = np.flatnonzero(~bit_parallel)[start:start + batch_size]
+            comparison_distances[batch] = batch_levenshtein([normalized[i] for i in guess_ids[batch].tolist()], 
+                                                            [answers[i] for i in answer_ids[batch].tolist()])
+
+        correct = np.zeros(len(guesses), dtype=bool)
+        np.logical_or.at(correct, guess_ids, comparison_distances <= allowed)
+        distances = np.full(len(guesses), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(distances, guess_ids, comparison_distances)
+        return correct, distances
+
+    def closest(self, guess: str, max_distance: float=math.inf) -> Tuple[Optional[str], float]:
+        """
+        Returns the title whose accepted answers are closest to a guess, and
+        the edit distance to that answer. (None, max_distance) is returned if
+        no answer is within max_distance of the guess.
+        """
+        guess = normalize_guess(guess)
+        title_id = self.answer_titles.get(guess)
+        if title_id is not None:
+            return self.titles[title_id], 0
+        answer, distance = self.index.closest(guess, max_distance)
+        if answer is None:
+            return None, max_distance
+        return self.titles[self.answer_titles[answer]], distance
+
+def load_shared_matcher(titles: Tuple[str, ...],
+                        acceptable_answers: Optional[dict]=None,
+                        remove_parentheses: Optional[bool]=False,
+                        keep_parentheses: Optional[List]=None) -> TitleMatcher:
+    """
+    Returns the process-wide TitleMatcher for the given arguments (see
+    TitleMatcher), building it on first use.
+    """
+    key = (tuple(titles),
+           tuple((title, tuple(answers)) for title, answers in (acceptable_answers or {}).items()),
+           bool(remove_parentheses),
+           tuple(keep_parentheses or []))
+    matcher = _SHARED_MATCHERS.get(key)
+    if matcher is None:
+        with _SHARED_MATCHERS_LOCK:
+            matcher = _SHARED_MATCHERS.get(key)
+            if matcher is None:
+                matcher = TitleMatcher(titles, acceptable_answers, remove_parentheses, keep_parentheses)
+                _SHARED_MATCHERS[key] = matcher
+    return matcher
@@ -0,0 +1,103 @@
+import random
+import sqlite3
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from servertools.Leaderboard import Leaderboards, DISPLAY_TIMEZONE
+
+EASY = "Easy (an entire section, e.g. chorus)"
+HARD = "Hard (1 line)"
+
+def brute_force_ranks(rows):
+    """
+    Returns the rank of each row, formatted as a dict where the row id is the
+    key, given rows (row_id, points, rounds, timestamp) of one leaderboard.
+    """
+    ordered = sorted(rows, key=lambda row: (-row[1], -row[2], row[3], row[0]))
+    return {row[0]: rank for rank, row in enumerate(ordered, 1)}
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "leaderboard.db")
+
+def test_ranks_match_brute_force(db_path):
+    rng = random.Random(0)
+    rows = {EASY: [], HARD: []}
+    with Leaderboards(db_path) as leaderboard:
+        for _ in range(20):
+            # batches whose entries tie and outscore each other, so that the
+            # entries added earlier in the transaction have to be counted
+            entries = [(rng.choice([EASY, HARD]), ("player", rng.randint(-3, 15), rng.randint(1, 5), rng.randint(0, 5)))
+                       for _ in range(rng.randint(1, 8))]
+            for (difficulty, (_, points, rounds, timestamp)), (row_id, rank) in zip(entries, leaderboard.add_many_to_leaderboards(entries)):
+                rows[difficulty].append((row_id, points, rounds, timestamp))
+                assert rank == brute_force_ranks(rows[difficulty])[row_id]
+
+        for difficulty in (EASY, HARD):
+            ranks = brute_force_ranks(rows[difficulty])
+            assert leaderboard.count_entries(difficulty) == len(rows[difficulty])
+            for row_id, _, _, _ in rows[difficulty]:
+                assert leaderboard.get_rank(difficulty, row_id) == ranks[row_id]
+            # and within a window, among the rows submitted since then
+            recent = [row for row in rows[difficulty] if row[3] >= 3]
+            recent_ranks = brute_force_ranks(recent)
+            assert leaderboard.count_entries(difficulty, since=3) == len(recent)
+            for row_id, _, _, timestamp in rows[difficulty]:
+                assert leaderboard.get_rank(difficulty, row_id, since=3) == recent_ranks.get(row_id)
+
+def test_sees_writes_from_other_connections(db_path):
+    with Leaderboards(db_path) as leaderboard:
+        for points in range(100):
+            leaderboard.add_to_leaderboard(EASY, ("player", points, 5, 0))
+        row_id, rank = leaderboard.add_to_leaderboard(EASY, ("me", 99, 5, 1))
+        assert rank == 2
+        assert leaderboard.count_entries(EASY) == 101
+        assert len(leaderboard.get_leaderboard(EASY)) == 101
+
+    # e.g. another worker process, or a manual cleanup
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.executemany("""INSERT INTO leaderboard (difficulty, name, points, rounds, timestamp)
+                                  VALUES ('easy', 'other', 1000, 1, 0)""", [()] * 50)
+    with Leaderboards(db_path) as leaderboard:
+        assert leaderboard.get_rank(EASY, row_id) == 52
+        assert leaderboard.count_entries(EASY) == 151
+        assert len(leaderboard.get_leaderboard(EASY)) == 151
+        assert leaderboard.add_to_leaderboard(EASY, ("you", 999, 5, 2))[1] == 51
+
+    with connection:
+        connection.execute("DELETE FROM leaderboard WHERE name = 'other'")
+    connection.close()
+    with Leaderboards(db_path) as leaderboard:
+        assert leaderboard.get_rank(EASY, row_id) == 3
+        assert leaderboard.count_entries(EASY) == 102
+        assert leaderboard.get_score_stats(EASY, 99).beat_you == 1
+
+def test_migrates_legacy_tables(db_path):
+    connection = sqlite3.connect(db_path)
+    with connection:
+        for difficulty in ["easy", "hard"]:
+            connection.execute(f"""CREATE TABLE leaderboard_{difficulty} (
+                                     id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, 
+                                     points INTEGER, rounds INTEGER, datetime TEXT)""")
+        connection.executemany("INSERT INTO leaderboard_easy (name, points, rounds, datetime) VALUES (?, ?, ?, ?)",
+                               [("a", 10, 12, "2024-01-15 12:00:00"), ("b", 10, 12, "2024-07-04 09:30:00"), 
+                                ("c", 20, 25, "2024-03-01 00:00:00")])
+        connection.execute("INSERT INTO leaderboard_hard (name, points, rounds, datetime) VALUES ('d', 5, 3, '2024-02-02 02:02:02')")
+    connection.close()
+
+    with Leaderboards(db_path) as leaderboard:
+        assert leaderboard.count_entries(EASY) == 3
+        assert leaderboard.count_entries(HARD) == 1
+        assert leaderboard.count_entries("Medium (2 lines)") == 0
+        assert list(leaderboard.get_leaderboard(EASY)["Name"]) == ["c", "a", "b"]
+        tables = {name for name, in leaderboard.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert not tables & {"leaderboard_easy", "leaderboard_medium", "leaderboard_hard"}
+        timestamps = dict(leaderboard.connection.execute("SELECT name, timestamp FROM leaderboard"))
+
+    # the legacy datetimes are Eastern time, whether or not daylight saving applies
+    eastern = ZoneInfo(DISPLAY_TIMEZONE)
+    assert timestamps["a"] == datetime(2024, 1, 15, 12, tzinfo=eastern).timestamp() == 1705338000
+    assert timestamps["b"] == datetime(2024, 7, 4, 9, 30, tzinfo=eastern).timestamp() == 1720099800
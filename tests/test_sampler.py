@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from servertools.Sampler import PermutationSampler
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 16, 17, 100, 1023, 4097])
+def test_each_permutation_draws_every_index_once(size):
+    sampler = PermutationSampler(size, seed=size)
+    for _ in range(3):
+        draws = sampler.draw_many(size)
+        assert sorted(draws.tolist()) == list(range(size))
+
+def test_draws_across_permutations():
+    sampler = PermutationSampler(10, seed=1)
+    draws = sampler.draw_many(25)
+    assert sorted(draws[:10].tolist()) == list(range(10))
+    assert sorted(draws[10:20].tolist()) == list(range(10))
+    assert sampler.epoch == 2 and sampler.position == 5
+    # each permutation is shuffled differently
+    assert draws[:10].tolist() != draws[10:20].tolist()
+
+def test_same_seed_same_draws():
+    first = PermutationSampler(1000, seed=42)
+    second = PermutationSampler(1000, seed=42)
+    draws = [second.draw() for _ in range(1500)]
+    assert first.draw_many(1500).tolist() == draws
+    assert PermutationSampler(1000, seed=43).draw_many(1500).tolist() != draws
+
+def test_draw_many_zero():
+    draws = PermutationSampler(5, seed=0).draw_many(0)
+    assert draws.dtype == np.int64 and len(draws) == 0
+
+def test_rejects_empty_range():
+    with pytest.raises(ValueError):
+        PermutationSampler(0)
@@ -0,0 +1,56 @@
+import random
+
+from servertools.ScoreDistribution import ScoreDistribution
+
+def brute_force_stats(scores, points):
+    above = sum(score > points for score in scores)
+    below = sum(score < points for score in scores)
+    return above + 1, above, len(scores), 100 * below / len(scores) if scores else 0.0
+
+def test_counts_match_brute_force():
+    rng = random.Random(0)
+    distribution = ScoreDistribution()
+    scores = []
+    for _ in range(500):
+        points = rng.randint(-20, 300)
+        distribution.add(points)
+        scores.append(points)
+    for points in range(-30, 310):
+        assert distribution.count_at_most(points) == sum(score <= points for score in scores)
+        assert distribution.count_above(points) == sum(score > points for score in scores)
+        assert tuple(distribution.stats(points)) == brute_force_stats(scores, points)
+
+def test_grows_above_its_range():
+    distribution = ScoreDistribution({0: 2, 10: 3})
+    size = len(distribution.tree)
+    distribution.add(10_000, 4)
+    assert len(distribution.tree) > size
+    assert distribution.total == 9
+    assert distribution.count_above(10) == 4
+    assert distribution.count_at_most(9_999) == 5
+    assert distribution.count_at_most(10_000) == 9
+
+def test_rebuilds_below_its_minimum():
+    distribution = ScoreDistribution({0: 1, 5: 2, 200: 1})
+    distribution.add(-3)
+    assert distribution.minimum <= -3
+    assert distribution.count_at_most(-4) == 0
+    assert distribution.count_at_most(-3) == 1
+    assert distribution.count_at_most(0) == 2
+    assert distribution.count_above(5) == 1
+    # far below: the tree is rebuilt again, keeping every count
+    distribution.add(-1_000, 2)
+    assert distribution.total == 7
+    assert distribution.count_at_most(-1_000) == 2
+    assert distribution.count_above(-1_000) == 5
+    assert distribution.stats(5).rank == 2
+
+def test_constructor_counts_negative_points():
+    distribution = ScoreDistribution({-7: 1, 3: 2})
+    assert distribution.count_at_most(-8) == 0
+    assert distribution.count_at_most(-7) == 1
+    assert distribution.count_above(-7) == 2
+
+def test_empty():
+    distribution = ScoreDistribution()
+    assert tuple(distribution.stats(10)) == (1, 0, 0, 0.0)
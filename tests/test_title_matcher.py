@@ -0,0 +1,59 @@
+import random
+
+from servertools.TitleMatcher import TitleMatcher, bounded_levenshtein, batch_levenshtein, normalize_guess
+
+def levenshtein(a, b):
+    """The textbook dynamic program, as a reference."""
+    previous = list(range(len(b) + 1))
+    for i, a_char in enumerate(a, 1):
+        current = [i]
+        for j, b_char in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a_char != b_char)))
+        previous = current
+    return previous[-1]
+
+def random_words(rng, n, max_length, alphabet="abcde (')"):
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length))) for _ in range(n)]
+
+def test_bounded_levenshtein():
+    rng = random.Random(0)
+    for a, b in zip(random_words(rng, 500, 20), random_words(rng, 500, 20)):
+        distance = levenshtein(a, b)
+        for max_distance in (0, 2, 5, 100):
+            assert bounded_levenshtein(a, b, max_distance) == min(distance, max_distance + 1)
+
+def test_batch_levenshtein():
+    rng = random.Random(1)
+    a = random_words(rng, 300, 90) + ["", "abc", ""]
+    b = random_words(rng, 300, 90) + ["abc", "", ""]
+    expected = [levenshtein(x, y) for x, y in zip(a, b)]
+    assert batch_levenshtein(a, b).tolist() == expected
+    assert len(batch_levenshtein([], [])) == 0
+
+def test_evaluate_guesses_matches_is_correct():
+    rng = random.Random(2)
+    # titles both within and beyond the bit-parallel limit of 63 characters
+    titles = random_words(rng, 40, 30, alphabet="abcdefgh ") + random_words(rng, 10, 100, alphabet="abcdefgh ")
+    titles = list(dict.fromkeys(title for title in titles if title.strip()))
+    acceptable_answers = {titles[0]: ["Alias", titles[1]]}
+    matcher = TitleMatcher(titles, acceptable_answers=acceptable_answers)
+
+    guesses, track_ids = [], []
+    for _ in range(1000):
+        track_id = rng.randrange(len(titles))
+        guess = rng.choice(titles) if rng.random() < 0.3 else titles[track_id]
+        # typos, unknown characters and case changes
+        for _ in range(rng.randint(0, 6)):
+            position = rng.randint(0, len(guess))
+            guess = guess[:position] + rng.choice("abcxyzÉ ") + guess[position + 1:]
+        guesses.append(guess.upper() if rng.random() < 0.2 else guess)
+        track_ids.append(track_id)
+    guesses += ["", "  ALIAS "]
+    track_ids += [1, 0]
+
+    correct, distances = matcher.evaluate_guesses(guesses, track_ids, batch_size=64)
+    for guess, track_id, is_correct, distance in zip(guesses, track_ids, correct, distances):
+        answers = [answer for answer, _ in matcher.answers[track_id]]
+        assert is_correct == matcher.is_correct(guess, titles[track_id])
+        assert distance == min(levenshtein(normalize_guess(guess), answer) for answer in answers)
+    assert correct[-1] and distances[-1] == 0